@@ -1,14 +1,31 @@
+import threading
+import time
+
 import cv2
+import imageio
 from PIL import Image, ImageTk
 import customtkinter as ctk
 
 
 class WcmApp:
-    def __init__(self ):
+    # The Tk widgets are only touched by the thread running start(). Other threads hand frames to
+    # update_video_feed(), which keeps only the newest one, and a Tk after() tick paced to fps draws it
+    def __init__(self, size=(600, 660), fps=30, loader='loader.gif'):
         self.root = None
         self.canvas = None
         self.button_a = None
         self.button_b = None
+        self.size = size  # (width, height) of the video canvas
+        self.interval = max(1, round(1000 / fps))  # (ms) render tick
+        self.frame = None  # single-slot mailbox, newest BGR frame not yet shown
+        self.lock = threading.Lock()
+        self.photo = None  # persistent PhotoImage shown by the canvas, frames are pasted into it
+        self.loader = loader  # animation shown by show_loader()
+        self.loader_frames = []  # display-sized PIL images, decoded once by start()
+        self.loader_delay = 0.1  # (s) animation frame time
+        self.loader_on = False
+        self.loader_next = 0.0  # time.monotonic() of the next animation frame
+        self.loader_index = 0
 
     def start(self):
         self.root = ctk.CTk()
@@ -18,8 +35,12 @@ class WcmApp:
         main_frame = ctk.CTkFrame(self.root, fg_color="#3A3A3A", bg_color="#3A3A3A")
         main_frame.pack(side="right", fill='both', padx=28, pady=28, expand=True)
 
-        self.canvas = ctk.CTkCanvas(main_frame, width=600, height=660)
+        self.canvas = ctk.CTkCanvas(main_frame, width=self.size[0], height=self.size[1])
         self.canvas.pack()
+        self.photo = ImageTk.PhotoImage('RGB', self.size)
+        self.canvas.create_image(0, 0, anchor="nw", image=self.photo)
+        self.load_animation()
+        self.root.after(self.interval, self.render)
 
         sidebar = ctk.CTkFrame(self.root, width=140, height=self.root.winfo_screenheight(), bg_color="#3A3A3A")
         sidebar.pack(side='left', fill='y')
@@ -63,14 +84,38 @@ class WcmApp:
     def exit_button_event(self):
         self.root.destroy()
 
+    def load_animation(self):
+        # Decodes the loader GIF once into display-sized RGB images ready to paste
+        try:
+            frames = imageio.mimread(self.loader)
+        except (OSError, ValueError) as e:
+            print(f'WARNING: loader animation {self.loader} not loaded: {e}')
+            return
+        self.loader_frames = [Image.fromarray(cv2.resize(x[..., :3], self.size, interpolation=cv2.INTER_AREA))
+                              for x in frames]  # GIF frames are RGB(A)
+
+    def show_loader(self):
+        # Thread-safe: plays the loader animation from the render tick until the next update_video_feed()
+        with self.lock:
+            self.frame, self.loader_on = None, True
+
     def update_video_feed(self, reqImg):
-        frame = cv2.cvtColor( reqImg, cv2.COLOR_BGR2RGB)
-        image = Image.fromarray(frame)
-        image = image.resize((600, 660), Image.ANTIALIAS)
-        image_tk = ImageTk.PhotoImage(image)
-        self.canvas.create_image(0, 0, anchor="nw", image=image_tk)
-        self.canvas.image = image_tk
-        self.canvas.after(10, self.update_video_feed)
+        # Thread-safe, never blocks: replaces the pending frame, frames arriving faster than the render tick are dropped
+        with self.lock:
+            self.frame, self.loader_on = reqImg, False
+
+    def render(self):
+        # Tk thread: shows the pending frame, if any, in the persistent canvas image and reschedules itself
+        with self.lock:
+            frame, self.frame = self.frame, None
+        if frame is not None:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_LINEAR)
+            self.photo.paste(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+        elif self.loader_on and self.loader_frames and time.monotonic() >= self.loader_next:
+            self.loader_index = (self.loader_index + 1) % len(self.loader_frames)
+            self.photo.paste(self.loader_frames[self.loader_index])
+            self.loader_next = time.monotonic() + self.loader_delay
+        self.root.after(self.interval, self.render)
 
 
 
@@ -1,21 +1,25 @@
 import argparse
 import time
+from itertools import count
 from pathlib import Path
 import cv2
+import numpy as np
 import torch
 import torch.backends.cudnn as cudnn
-from numpy import random
 
-from models.experimental import attempt_load
-from utils.datasets import LoadStreams, LoadImages
+from models.experimental import load_resident
+from models.yolo import Model
+from utils.datasets import LoadStreams, LoadImages, LetterboxBuffer
+from utils.distance import CalibrationStore, DistanceEstimator, FrameResult
 from utils.general import check_img_size, check_requirements, check_imshow, non_max_suppression, apply_classifier, \
     scale_coords, xyxy2xywh, strip_optimizer, set_logging, increment_path
+from utils.pipeline import Pipeline
 from utils.plots import plot_one_box
+from utils.sink import MediaSink
 from utils.torch_utils import select_device, load_classifier, time_synchronized
 import threading
 
 import os
-import imageio
 
 
 from app import WcmApp
@@ -39,7 +43,10 @@ class Detect:
                                      update=False, 
                                      view_img=False, 
                                      weights='', 
-                                     read = False)
+                                     read = False,
+                                     pipeline=False,
+                                     sink='block',
+                                     onnx='auto')
         self.width_in_rf = 0
         self.label = ''
         self.KNOWN_DISTANCE = 25.0
@@ -50,9 +57,14 @@ class Detect:
         self.CHAIR_WIDTH = 55
         self.SOFA_WIDTH = 100
         self.TABLE_WIDTH = 100
+        self.LABELS = {'couch': 'sofa', 'dining table': 'table'}  # display names
+        self.focals = {}  # {class name: focal length}, set from the reference calibration
+        self.names = []  # class names of the model used by the last stream()
         self.CONFIDENCE_THRESHOLD = 0.4
         self.NMS_THRESHOLD = 0.3
         self.distance = 0
+        self.device = None  # selected once, reused by every detect() call
+        self.calibration = CalibrationStore('ref/calibration.json')  # persisted read_focal() results
         
     # def start_wcmApp(self, image):
     #     wcmApp = WcmApp(image)
@@ -70,221 +82,210 @@ class Detect:
         return distance
     
     
-    def detect(self, save_img=False):
-
-        
-        source, weights, view_img, save_txt, imgsz = self.opt.source, self.opt.weights, self.opt.view_img, self.opt.save_txt, self.opt.img_size
-        save_img = not self.opt.nosave and not source.endswith('.txt')  # save inference images
-        webcam = source.isnumeric() or source.endswith('.txt') or source.lower().startswith(
+    def load(self, source=None):
+        # Selects the device, takes the resident model and opens the dataloader for source. Sets self.model, self.names
+        # and self.estimator for capture() and infer(), returns the dataset
+        source, weights, imgsz = source or self.opt.source, self.opt.weights, self.opt.img_size
+        self.webcam = source.isnumeric() or source.endswith('.txt') or source.lower().startswith(
             ('rtsp://', 'rtmp://', 'http://', 'https://'))
-    
-        # Directories
-        save_dir = Path(increment_path(Path(self.opt.project) / self.opt.name, exist_ok=self.opt.exist_ok))  # increment run
-        (save_dir / 'labels' if save_txt else save_dir).mkdir(parents=True, exist_ok=True)  # make dir
 
         # Initialize
         set_logging()
-        device = select_device(self.opt.device)
-        half = device.type != 'cpu'  # half precision only supported on CUDA
-
-        # Load model
-        model = attempt_load(weights, map_location=device)  # load FP32 model
-        stride = int(model.stride.max())  # model stride
-        imgsz = check_img_size(imgsz, s=stride)  # check img_size
-        if half:
-            model.half()  # to FP16
+        if self.device is None:
+            self.device = select_device(self.opt.device)
+        device = self.device
+        self.half = device.type != 'cpu'  # half precision only supported on CUDA
+
+        # Load model (resident, shared by every call with the same weights/device/precision)
+        self.model = load_resident(weights, device, half=self.half, imgsz=imgsz, onnx=self.opt.onnx, fold=True,
+                                   classes=self.opt.classes)  # head pruned to opt.classes where supported
+        self.nms_classes = None if getattr(self.model, 'class_ids', None) else self.opt.classes
+        stride = int(self.model.stride.max())  # model stride
+        # Detect() head decodes only the cells NMS keeps as candidates, per call so the shared model is left unchanged
+        self.forward_kw = {'sparse_thres': self.opt.conf_thres} if isinstance(self.model, Model) else {}
+        if getattr(self.model, 'dynamic', True):
+            imgsz, self.auto = check_img_size(imgsz, s=stride), True  # check img_size
+        else:  # exported model with a fixed input shape
+            imgsz, self.auto = self.model.imgsz, False
+        self.imgsz, self.stride = imgsz, stride
 
         # Second-stage classifier
         classify = False
+        self.modelc = None
         if classify:
-            modelc = load_classifier(name='resnet101', n=2)  # initialize
-            modelc.load_state_dict(torch.load('weights/resnet101.pt', map_location=device)['model']).to(device).eval()
+            self.modelc = load_classifier(name='resnet101', n=2)  # initialize
+            self.modelc.load_state_dict(torch.load('weights/resnet101.pt', map_location=device)['model']).to(device).eval()
 
         # Set Dataloader
-        vid_path, vid_writer = None, None
-        if webcam:
-            view_img = check_imshow()
+        if self.webcam:
             cudnn.benchmark = True  # set True to speed up constant image size inference
-            dataset = LoadStreams(source, img_size=imgsz, stride=stride)
+            dataset = LoadStreams(source, img_size=imgsz, stride=stride, raw=True)
         else:
-            dataset = LoadImages(source, img_size=imgsz, stride=stride)
+            dataset = LoadImages(source, img_size=imgsz, stride=stride, raw=True)
+
+        # Get names and distance lookup tables
+        self.names = self.model.module.names if hasattr(self.model, 'module') else self.model.names
+        self.estimator = DistanceEstimator(self.names, self.focals, self.KNOWN_DISTANCE)
+        self.frame_ids = count()  # running FrameResult id
+        return dataset
+
+    def capture(self, dataset):
+        # Capture stage: yields (path, img, plans, im0s, vid_cap, t, frame, mode) with img as a normalized device tensor,
+        # plans the LetterboxPlan and t the time.monotonic() capture time of each image. img is reused, pipelined it is
+        # one of 4 buffer slots leased until self.buffer.release(img)
+        self.buffer = buffer = LetterboxBuffer(self.imgsz, self.stride, self.device, self.half,
+                                               auto=self.auto and getattr(dataset, 'rect', True),
+                                               slots=4 if self.opt.pipeline else 1,
+                                               fold=getattr(self.model, 'input_fold', None), lease=self.opt.pipeline)
+        for path, _, im0s, vid_cap in dataset:
+            t = dataset.frame_stamps if self.webcam else [time.monotonic()]  # capture time per image
+            img, plans = buffer(im0s if self.webcam else [im0s])
+            yield path, img, plans, im0s, vid_cap, t, dataset.count if self.webcam else getattr(dataset, 'frame', 0), dataset.mode
+
+    @torch.no_grad()
+    def infer(self, batch):
+        # Inference stage: forward pass, NMS and distance post-processing, returns a list of FrameResult per image
+        path, img, plans, im0s, vid_cap, t, frame, mode = batch
+
+        # Inference
+        t1 = time_synchronized()
+        pred = self.model(img, augment=self.opt.augment, **self.forward_kw)[0]
+
+        # Apply NMS
+        pred = non_max_suppression(pred, self.opt.conf_thres, self.opt.iou_thres, classes=self.nms_classes, agnostic=self.opt.agnostic_nms)
+        t2 = time_synchronized()
+
+        # Apply Classifier
+        if self.modelc is not None:
+            pred = apply_classifier(pred, self.modelc, img, im0s)
+
+        # Process detections
+        results = []
+        for i, det in enumerate(pred):  # detections per image
+            p, im0 = (path[i], im0s[i]) if self.webcam else (path, im0s)  # batch_size >= 1 for streams
+            det[:, :4] = scale_coords(img.shape[2:], det[:, :4], im0.shape, plans[i].ratio_pad).round()  # to im0 size
+            results.append(FrameResult(next(self.frame_ids), t[i], p, i, frame, mode, im0, img.shape[2:],
+                                       self.estimator(det, im0.shape[1]), t2 - t1, vid_cap))
+        return results
+
+    def stream(self, source=None):
+        # Yields a FrameResult (frame id, capture time, boxes, classes, confidences, distances, zones) per image without
+        # drawing, saving or touching the GUI, so consumers only pay for the outputs they use
+        for batch in self.capture(self.load(source)):
+            yield from self.infer(batch)
 
-        # Get names and colors
-        names = model.module.names if hasattr(model, 'module') else model.names
-        colors = [[random.randint(0, 255) for _ in range(3)] for _ in names]
+    def detect(self, save_img=False):
+        source, view_img, save_txt = self.opt.source, self.opt.view_img, self.opt.save_txt
+        save_img = not self.opt.nosave and not source.endswith('.txt')  # save inference images
+        webcam = source.isnumeric() or source.endswith('.txt') or source.lower().startswith(
+            ('rtsp://', 'rtmp://', 'http://', 'https://'))
+        if webcam:
+            view_img = check_imshow()
 
-        # Run inference
-        if device.type != 'cpu':
-            model(torch.zeros(1, 3, imgsz, imgsz).to(device).type_as(next(model.parameters())))  # run once
-        t0 = time.time()
-        for path, img, im0s, vid_cap in dataset:
-            img = torch.from_numpy(img).to(device)
-            img = img.half() if half else img.float()  # uint8 to fp16/32   
-            img /= 255.0  # 0 - 255 to 0.0 - 1.0
-            if img.ndimension() == 3:
-                img = img.unsqueeze(0)
-            
-            # Inference
-            t1 = time_synchronized()
-            pred = model(img, augment=self.opt.augment)[0]
-
-            # Apply NMS
-            pred = non_max_suppression(pred, self.opt.conf_thres, self.opt.iou_thres, classes=self.opt.classes, agnostic=self.opt.agnostic_nms)
-            t2 = time_synchronized()
-
-            # Apply Classifier
-            if classify:
-                pred = apply_classifier(pred, modelc, img, im0s)
+        # Directories
+        save_dir = Path(increment_path(Path(self.opt.project) / self.opt.name, exist_ok=self.opt.exist_ok))  # increment run
+        (save_dir / 'labels' if save_txt else save_dir).mkdir(parents=True, exist_ok=True)  # make dir
 
-        
-            # Process detections
-            for i, det in enumerate(pred):  # detections per image
-                if webcam:  # batch_size >= 1
-                    p, s, im0, frame = path[i], '%g: ' % i, im0s[i].copy(), dataset.count
+        sink = MediaSink(policy=self.opt.sink)  # every disk write happens on the sink thread
+
+        def render(f):
+            # Render stage: print, drawing and GUI for one FrameResult, label files and image/video saving go to sink
+            names, det = self.names, f.det
+            ids = getattr(self.model, 'class_ids', None)  # pruned head: original class index of each output class
+            cls = (lambda c: ids[c]) if ids else int
+            p, s, im0 = Path(f.path), '%g: ' % f.index if webcam else '', f.im0.copy() if webcam else f.im0
+            save_path = str(save_dir / p.name)  # img.jpg
+            txt_path = str(save_dir / 'labels' / p.stem) + ('' if f.mode == 'image' else f'_{f.frame}')  # img.txt
+            s += '%gx%g ' % tuple(f.shape)  # print string
+
+            gn = np.array(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
+            if len(det):
+                # Print results
+                for c, n in zip(*np.unique(det['cls'], return_counts=True)):
+                    s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
+
+                # Write results
+                if save_txt:  # Write to file
+                    lines = ''
+                    for r in det[::-1]:
+                        xywh = (xyxy2xywh(r['xyxy'][None]) / gn).ravel().tolist()  # normalized xywh
+                        line = (cls(r['cls']), *xywh, r['conf']) if self.opt.save_conf else (cls(r['cls']), *xywh)
+                        lines += ('%g ' * len(line)).rstrip() % line + '\n'
+                    sink.labels(txt_path + '.txt', lines)
+
+                if save_img or view_img:  # Add bbox to image
+                    self.width_in_rf = float(det[0]['xyxy'][2] - det[0]['xyxy'][0])  # most confident box
+                    self.label = f"{names[det[0]['cls']]} {cls(det[0]['cls'])}"
+
+                    if not self.opt.read:
+                        self.distance = float(det[0]['distance'])
+                        for r in det[::-1]:
+                            if r['far']:
+                                continue
+                            name = names[r['cls']]
+                            label = f"{self.LABELS.get(name, name)} {r['conf']:.2f} {r['distance']:.2f} meters"
+                            color = [0, 0, 255] if r['near'] else [255, 0, 0]  # red if near else blue
+                            plot_one_box(r['xyxy'], im0, label=label, color=color, line_thickness=1)
+
+            # Print time (inference + NMS)
+            latency = f' latency {time.monotonic() - f.t:.3f}s' if f.mode == 'stream' else ''  # capture to render
+            print(f'{s}Done. ({f.dt:.3f}s){latency}')
+
+            # # Stream results
+            # if view_img:
+            #     if(self.opt.read == False):
+            #         cv2.imshow(str(p), im0)
+            #     cv2.waitKey(1)  # 1 millisecond
+
+            # key= cv2.waitKey(1)
+            # if key == ord('q'):
+            #     break
+
+            # Save results (image with detections)
+            if save_img:
+                if (self.opt.read == False):
+                    wcmApp.update_video_feed(im0)
                 else:
-                    p, s, im0, frame = path, '', im0s, getattr(dataset, 'frame', 0)
-
-                p = Path(p)  # to Path
-                save_path = str(save_dir / p.name)  # img.jpg
-                txt_path = str(save_dir / 'labels' / p.stem) + ('' if dataset.mode == 'image' else f'_{frame}')  # img.txt
-                s += '%gx%g ' % img.shape[2:]  # print string
-                
-                gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
-                if len(det):
-                    # Rescale boxes from img_size to im0 size
-                    detected_classes = []
-                    detected_distance = []
-                    detected_area = []
-                    det[:, :4] = scale_coords(img.shape[2:], det[:, :4], im0.shape).round()
-
-                    # Print results
-                    for c in det[:, -1].unique():
-                        n = (det[:, -1] == c).sum()  # detections per class
-                        s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
-
-                    # Write results
-                    for *xyxy, conf, cls in reversed(det):
-                        if save_txt:  # Write to file
-                            xywh = (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()  # normalized xywh
-                            line = (cls, *xywh, conf) if self.opt.save_conf else (cls, *xywh)  # label format
-                            with open(txt_path + '.txt', 'a') as f:
-                                f.write(('%g ' * len(line)).rstrip() % line + '\n')
-
-                        if save_img or view_img:  # Add bbox to image
-                            label = f'{names[int(cls)]} {conf:.2f}'
-                            # get the width and height of the bounding box
-                            self.width_in_rf = xyxy[2] - xyxy[0]
-                            # Get the x-coordinate of the center of the bounding box
-                            bbox_center = (xyxy[0] + xyxy[2]) / 2
-                            # Get the x-coordinate of the center of the image
-                            image_center = im0.shape[1] / 2
-
-                            # Determine if the bounding box is on the left, center, or right of the image
-                            if bbox_center < image_center - 50:
-                                detected_area.append("left")
-                            elif bbox_center > image_center + 50:
-                                detected_area.append("right")
-                            else:
-                                detected_area.append("center")
-                            self.label = f'{names[int(cls)]} {int(cls)}'
-                            
-                            if (self.opt.read == False):
-                                if names[int(cls)] == 'person':
-                                    print(f"Person: {int(cls)}")
-                                    self.distance = self.distanceEstimate(focal_person, self.width_in_rf)
-                                elif names[int(cls)] == 'dog':
-                                    print(f"Dog: {int(cls)}")
-                                    self.distance = self.distanceEstimate(focal_dog, self.width_in_rf)
-                                elif names[int(cls)] == 'cat':
-                                    print(f"Cat: {int(cls)}")
-                                    self.distance = self.distanceEstimate(focal_cat, self.width_in_rf)
-                                elif names[int(cls)] == 'bed':
-                                    print(f"Bed: {int(cls)}")
-                                    self.distance = self.distanceEstimate(focal_bed, self.width_in_rf)
-                                elif names[int(cls)] == 'chair':
-                                    print(f"Chair: {int(cls)}")
-                                    self.distance = self.distanceEstimate(focal_chair, self.width_in_rf)
-                                elif names[int(cls)] == 'dining table':
-                                    print(f"Table: {int(cls)}")
-                                    self.distance = self.distanceEstimate(focal_table, self.width_in_rf)
-                                elif names[int(cls)] == 'couch':
-                                    print(f"Sofa: {int(cls)}")
-                                    self.distance = self.distanceEstimate(focal_sofa, self.width_in_rf)
-                                
-                                print (f"Distance: {self.distance} meters")
-                                if self.distance < 4:
-                                    # set colors to red
-                                    if self.distance < 2:
-                                        detected_classes.append(names[int(cls)])
-                                        detected_distance.append(self.distance)
-                                        if(names[int(cls)] == 'couch'):
-                                            label = f'sofa {conf:.2f} {self.distance:.2f} meters'
-                                        elif(names[int(cls)] == 'dining table'):
-                                            label = f'table {conf:.2f} {self.distance:.2f} meters'
-                                        else:
-                                            label = f'{names[int(cls)]} {conf:.2f} {self.distance:.2f} meters'
-                                        
-                                        colors[int(cls)] = [0, 0, 255]
-                                        plot_one_box(xyxy, im0, label=label, color=colors[int(cls)], line_thickness=1)
-                                    else:
-                                        if(names[int(cls)] == 'couch'):
-                                            label = f'sofa {conf:.2f} {self.distance:.2f} meters'
-                                        elif(names[int(cls)] == 'dining table'):
-                                            label = f'table {conf:.2f} {self.distance:.2f} meters'
-                                        else:
-                                            label = f'{names[int(cls)]} {conf:.2f} {self.distance:.2f} meters'
-                                        colors[int(cls)] = [255, 0, 0]
-                                        plot_one_box(xyxy, im0, label=label, color=colors[int(cls)], line_thickness=1)
-                                
-                # Print time (inference + NMS)
-                print(f'{s}Done. ({t2 - t1:.3f}s)')
-
-                # # Stream results
-                # if view_img:
-                #     if(self.opt.read == False):
-                #         cv2.imshow(str(p), im0)
-                #     cv2.waitKey(1)  # 1 millisecond
-                    
-                # key= cv2.waitKey(1)
-                # if key == ord('q'):
-                #     break
-
-                # Save results (image with detections)
-                if save_img:
-                    if (self.opt.read == False):
-                        wcmApp.update_video_feed(im0)
-                    else:
-                        # Read the GIF image using imageio
-                        gif_path = 'loader.gif'
-                        gif = imageio.mimread(gif_path)
-
-                        for frame in gif:
-                            wcmApp.update_video_feed(frame)
-                            time.sleep(0.1)
-                    
-                    if dataset.mode == 'image':
-                        cv2.imwrite(save_path, im0)
-                    else:  # 'video' or 'stream'
-                        if vid_path != save_path:  # new video
-                            vid_path = save_path
-                            if isinstance(vid_writer, cv2.VideoWriter):
-                                vid_writer.release()  # release previous video writer
-                            if vid_cap:  # video
-                                fps = vid_cap.get(cv2.CAP_PROP_FPS)
-                                w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                                h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                            else:  # stream
-                                fps, w, h = 30, im0.shape[1], im0.shape[0]
-                                save_path += '.mp4'
-                            vid_writer = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
-                        vid_writer.write(im0)
+                    wcmApp.show_loader()  # played by the GUI timer, decoded once at startup
+
+                if f.mode == 'image':
+                    sink.image(save_path, im0)
+                else:  # 'video' or 'stream'
+                    if f.vid_cap:  # video
+                        fps = f.vid_cap.get(cv2.CAP_PROP_FPS)
+                        w = int(f.vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                        h = int(f.vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                    else:  # stream
+                        fps, w, h = 30, im0.shape[1], im0.shape[0]
+                        save_path += '.mp4'
+                    sink.video(save_path, im0, fps, w, h)
+
+        t0 = time.time()
+        with sink:
+            if self.opt.pipeline:  # capture, inference and render each in their own thread
+                def infer(batch):
+                    try:
+                        return self.infer(batch)
+                    finally:
+                        self.buffer.release(batch[1])  # img slot free for capture again
+
+                def render_all(frames):
+                    for f in frames:
+                        render(f)
+
+                dataset = self.load(source)
+                Pipeline(self.capture(dataset), infer, render_all, drop=self.webcam,
+                         release=lambda batch: self.buffer.release(batch[1])).run()
+            else:
+                for f in self.stream(source):
+                    render(f)
 
         if save_txt or save_img:
             s = f"\n{len(list(save_dir.glob('labels/*.txt')))} labels saved to {save_dir / 'labels'}" if save_txt else ''
             print(f"Results saved to {save_dir}{s}")
-            
+
         print(f'Done. ({time.time() - t0:.3f}s)')
-    
+
     def config(self, weights, source, classes, read, view_img):
         self.opt.weights = weights
         self.opt.source = source
@@ -293,19 +294,78 @@ class Detect:
         self.opt.view_img = view_img
 
     def read_focal(self, model, src, classes, width):
-   
+        # Reuse the stored calibration while the reference image, weights, img_size and known width are unchanged
+        key = self.calibration.key(src, model, self.opt.img_size, width, self.KNOWN_DISTANCE)
+        cached = self.calibration.get(src, key)
+        if cached:
+            self.width_in_rf = cached[0]
+            return cached
+
         self.config(model, src, classes, True, False)
+        self.width_in_rf = 0
 
         self.detect()
 
         focal_length = self.focalLength(self.width_in_rf, width)
+        if self.width_in_rf:  # only store successful calibrations
+            self.calibration.put(src, key, self.width_in_rf, focal_length)
 
         return self.width_in_rf, focal_length
         
                
+    def read_focals(self, model, refs):
+        # read_focal() for a list of (source, class, known width), every uncached reference is calibrated in one batch
+        keys = [self.calibration.key(src, model, self.opt.img_size, width, self.KNOWN_DISTANCE) for src, _, width in refs]
+        results = [self.calibration.get(src, key) for (src, _, _), key in zip(refs, keys)]
+        todo = [i for i, r in enumerate(results) if r is None]
+        if todo:
+            wcmApp.show_loader()  # played by the GUI timer until the first video frame
+            for i, r in zip(todo, self.calibrate(model, [refs[i] for i in todo])):
+                results[i] = r
+                if r[0]:  # only store successful calibrations
+                    self.calibration.put(refs[i][0], keys[i], *r)
+        return results
+
+    @torch.no_grad()
+    def calibrate(self, weights, refs):
+        # Letterboxes all reference images (source, class, known width) into one batch and runs a single forward pass
+        # and NMS call. Returns [(width_px, focal_length), ...] in refs order, width_px is 0 if the class was not found
+        if self.device is None:
+            self.device = select_device(self.opt.device)
+        device = self.device
+        half = device.type != 'cpu'  # half precision only supported on CUDA
+        model = load_resident(weights, device, half=half, imgsz=self.opt.img_size, onnx=self.opt.onnx, fold=True)
+        stride = int(model.stride.max())  # model stride
+        imgsz = check_img_size(self.opt.img_size, s=stride) if getattr(model, 'dynamic', True) else model.imgsz
+
+        im0s = []
+        for src, _, _ in refs:
+            im0 = cv2.imread(src)  # BGR
+            assert im0 is not None, 'Image Not Found ' + src
+            im0s.append(im0)
+        fold = getattr(model, 'input_fold', None)
+        img, plans = LetterboxBuffer(imgsz, stride, device, half, auto=False, fold=fold)(im0s)  # common square shape
+
+        t1 = time_synchronized()
+        pred = model(img, augment=self.opt.augment)[0]
+        classes = sorted({c for _, c, _ in refs})
+        pred = non_max_suppression(pred, self.opt.conf_thres, self.opt.iou_thres, classes=classes, agnostic=self.opt.agnostic_nms)
+        t2 = time_synchronized()
+        print(f'Calibrated {len(refs)} reference images. ({t2 - t1:.3f}s)')
+
+        results = []
+        for (src, c, width), det, im0, plan in zip(refs, pred, im0s, plans):
+            det = det[det[:, 5] == c]  # this reference's class, sorted by confidence
+            width_px = 0
+            if len(det):
+                det[:, :4] = scale_coords(img.shape[2:], det[:, :4], im0.shape, plan.ratio_pad).round()
+                width_px = float(det[0, 2] - det[0, 0])  # most confident box
+            results.append((width_px, self.focalLength(width_px, width)))
+        return results
+
     def parse_opt(self):
         parser = argparse.ArgumentParser()
-        parser.add_argument('--weights', nargs='+', type=str, default='weights/v5lite-s.pt', help='model.pt path(s)')
+        parser.add_argument('--weights', nargs='+', type=str, default='weights/v5lite-s.pt', help='model.pt, .torchscript or .onnx path(s)')
         parser.add_argument('--source', type=str, default='sample', help='source')  # file/folder, 0 for webcam
         parser.add_argument('--img-size', type=int, default=640, help='inference size (pixels)')
         parser.add_argument('--conf-thres', type=float, default=0.45, help='object confidence threshold')
@@ -323,6 +383,9 @@ class Detect:
         parser.add_argument('--name', default='exp', help='save results to project/name')
         parser.add_argument('--exist-ok', action='store_true', help='existing project/name ok, do not increment')
         parser.add_argument('--read', action='store_true')
+        parser.add_argument('--pipeline', action='store_true', help='run capture, inference and rendering in parallel')
+        parser.add_argument('--sink', default='block', choices=MediaSink.policies, help='disk writer policy when its queue is full')
+        parser.add_argument('--onnx', default='auto', choices=['auto', 'onnxruntime', 'dnn'], help='*.onnx weights runtime')
         self.opt = parser.parse_args()
         print(self.opt)
         check_requirements(exclude=('pycocotools', 'thop'))
@@ -355,13 +418,15 @@ focal_sofa = 0
 
 obs = Detect()
 
-person_width_px, focal_person = obs.read_focal('weights/v5lite-g.pt', 'ref/person.jpg', 0, obs.PERSON_WIDTH)
-dog_width_px, focal_dog = obs.read_focal('weights/v5lite-g.pt', 'ref/dog.jpg', 16, obs.DOG_WIDTH)
-cat_width_px, focal_cat = obs.read_focal('weights/v5lite-g.pt', 'ref/cat.jpg', 15, obs.CAT_WIDTH)
-bed_width_px, focal_bed = obs.read_focal('weights/v5lite-g.pt', 'ref/Bed.jpeg', 59, obs.BED_WIDTH)
-chair_width_px, focal_chair = obs.read_focal('weights/v5lite-g.pt', 'ref/chair.jpg', 56, obs.CHAIR_WIDTH)
-table_width_px, focal_table = obs.read_focal('weights/v5lite-g.pt', 'ref/table.jpg', 60, obs.TABLE_WIDTH)
-sofa_width_px, focal_sofa = obs.read_focal('weights/v5lite-g.pt', 'ref/sofa.jpg', 57, obs.SOFA_WIDTH)
+(person_width_px, focal_person), (dog_width_px, focal_dog), (cat_width_px, focal_cat), (bed_width_px, focal_bed), \
+    (chair_width_px, focal_chair), (table_width_px, focal_table), (sofa_width_px, focal_sofa) = \
+    obs.read_focals('weights/v5lite-g.pt', [('ref/person.jpg', 0, obs.PERSON_WIDTH),
+                                            ('ref/dog.jpg', 16, obs.DOG_WIDTH),
+                                            ('ref/cat.jpg', 15, obs.CAT_WIDTH),
+                                            ('ref/Bed.jpeg', 59, obs.BED_WIDTH),
+                                            ('ref/chair.jpg', 56, obs.CHAIR_WIDTH),
+                                            ('ref/table.jpg', 60, obs.TABLE_WIDTH),
+                                            ('ref/sofa.jpg', 57, obs.SOFA_WIDTH)])
 
 print(f'Person focal length: {focal_person}')
 print(f'Dog focal length: {focal_dog}')
@@ -378,6 +443,9 @@ print(f'bed width: {bed_width_px}')
 print(f'chair focal length: {focal_chair}')
 print(f'chair width: {chair_width_px}')
 
+obs.focals = {'person': focal_person, 'dog': focal_dog, 'cat': focal_cat, 'bed': focal_bed, 'chair': focal_chair,
+              'dining table': focal_table, 'couch': focal_sofa}
+
 obs.config('weights/v5lite-s.pt', '0', [0, 16, 15, 59, 56, 60, 57], False, False)
 
 obs.detect()
@@ -5,6 +5,7 @@ Usage:
 """
 
 import argparse
+import json
 import sys
 import time
 
@@ -60,15 +61,25 @@ if __name__ == '__main__':
     print(model.model[-1])
     y = model(img)  # dry run
 
+    # Metadata read by models/backends.py to run and decode the exported model
+    m = model.model[-1]  # Detect()
+    meta = {'stride': m.stride.tolist(),
+            'anchors': m.anchor_grid.view(m.nl, -1, 2).tolist(),  # pixels
+            'names': labels,
+            'output': 'cat' if opt.concat else 'raw' if m.export else 'grid',
+            'imgsz': opt.img_size,
+            'batch': opt.batch_size,
+            'dynamic': opt.dynamic}
+
     # TorchScript export
-    # try:
-    #     print('\nStarting TorchScript export with torch %s...' % torch.__version__)
-    #     f = opt.weights.replace('.pt', '.torchscript.pt')  # filename
-    #     ts = torch.jit.trace(model, img)
-    #     ts.save(f)
-    #     print('TorchScript export success, saved as %s' % f)
-    # except Exception as e:
-    #     print('TorchScript export failure: %s' % e)
+    try:
+        print('\nStarting TorchScript export with torch %s...' % torch.__version__)
+        f = opt.weights.replace('.pt', '.torchscript')  # filename
+        ts = torch.jit.trace(model, img, strict=False)
+        torch.jit.save(ts, f, _extra_files={'config.txt': json.dumps(meta)})
+        print('TorchScript export success, saved as %s' % f)
+    except Exception as e:
+        print('TorchScript export failure: %s' % e)
 
     # ONNX export
     try:
@@ -84,6 +95,9 @@ if __name__ == '__main__':
         # Checks
         onnx_model = onnx.load(f)  # load onnx model
         onnx.checker.check_model(onnx_model)  # check onnx model
+        for k, v in meta.items():
+            onnx_model.metadata_props.add(key=k, value=json.dumps(v))
+        onnx.save(onnx_model, f)
         # print(onnx.helper.printable_graph(onnx_model.graph))  # print a human readable model
         print('ONNX export success, saved as %s' % f)
     except Exception as e:
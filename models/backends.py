@@ -0,0 +1,136 @@
+# Inference backends for exported models (TorchScript, ONNX Runtime, OpenCV DNN)
+
+import json
+import logging
+from pathlib import Path
+
+import torch
+
+from utils.general import check_requirements
+
+logger = logging.getLogger(__name__)
+
+
+def is_exported(weights):
+    # True for weights that load_backend() runs instead of attempt_load()
+    if isinstance(weights, (list, tuple)):
+        weights = weights[0] if len(weights) == 1 else ''  # ensembles are *.pt only
+    return Path(weights).suffix in ('.torchscript', '.onnx')
+
+
+class Backend:
+    # Runs an exported model like the eager one: __call__(img) returns (pred, None) with pred the decoded (bs,N,no)
+    # tensor non_max_suppression() expects. Export metadata (see export.py) provides stride, names, anchors, the input
+    # shape and the output format:
+    #   'grid'  decoded xywh+conf, used as is
+    #   'cat'   sigmoid outputs concatenated by Detect.cat_forward(), grid/anchors applied here
+    #   'raw'   per-level logits (Detect.export=True), sigmoid and grid/anchors applied here
+
+    def __init__(self, meta, device):
+        self.device = device
+        self.names = meta['names']
+        self.stride = torch.tensor(meta['stride'], dtype=torch.float32)
+        self.anchors = torch.tensor(meta['anchors'], dtype=torch.float32).view(len(self.stride), -1, 2)  # pixels
+        self.output = meta['output']
+        self.imgsz = tuple(meta['imgsz'])  # exported input (h, w)
+        self.batch = meta.get('batch', 1)
+        self.dynamic = meta.get('dynamic', False)  # False: inputs must be letterboxed to imgsz, auto=False
+        self.grids = {}  # input (h, w) -> (xy gain, xy offset, wh gain), each (N, 2)
+
+    def forward(self, img):
+        # img: (bs,3,h,w) fp32 tensor, returns the list of model outputs as tensors
+        raise NotImplementedError
+
+    def _grid(self, h, w):
+        if (h, w) not in self.grids:
+            gain, offset, wh = [], [], []
+            for s, a in zip(self.stride.tolist(), self.anchors):
+                ny, nx = h // int(s), w // int(s)
+                yv, xv = torch.meshgrid([torch.arange(ny), torch.arange(nx)])
+                xy = torch.stack((xv, yv), 2).view(1, -1, 2).float().expand(len(a), -1, -1).reshape(-1, 2)
+                gain.append(torch.full_like(xy, 2 * s))
+                offset.append((xy - 0.5) * s)
+                wh.append((a * 4).view(-1, 1, 2).expand(-1, ny * nx, -1).reshape(-1, 2))
+            self.grids[(h, w)] = [torch.cat(x).to(self.device) for x in (gain, offset, wh)]
+        return self.grids[(h, w)]
+
+    def decode(self, y, h, w):
+        if self.output == 'grid':
+            return y[0]
+        if self.output == 'raw':  # largest (stride 8) level first, as in Detect.forward()
+            y = sorted(y, key=lambda x: -x.numel())[:len(self.stride)]
+            y = torch.cat([x.reshape(x.shape[0], -1, x.shape[-1]) for x in y], 1).sigmoid()
+        else:  # 'cat'
+            y = y[0]
+        gain, offset, wh = self._grid(h, w)
+        return torch.cat((y[..., :2] * gain + offset, y[..., 2:4] ** 2 * wh, y[..., 4:]), -1)
+
+    def __call__(self, img, augment=False):
+        if augment:
+            logger.warning('augmented inference is only supported by PyTorch *.pt weights, ignoring --augment')
+        img, h, w = img.float(), *img.shape[2:]
+        n = len(img) if self.dynamic else self.batch
+        pred = []
+        for i in range(0, len(img), n):
+            x = img[i:i + n]
+            k = len(x)
+            if k < n:  # static export batch, zero-pad the last chunk and drop the padded outputs
+                x = torch.cat((x, x.new_zeros((n - k, *x.shape[1:]))))
+            pred.append(self.decode([y.to(self.device) for y in self.forward(x)], h, w)[:k])
+        return torch.cat(pred), None
+
+
+class TorchScriptBackend(Backend):
+    def __init__(self, w, device):
+        extra = {'config.txt': ''}
+        self.model = torch.jit.load(w, map_location=device, _extra_files=extra).float().eval()
+        super().__init__(json.loads(extra['config.txt']), device)
+
+    def forward(self, img):
+        y = self.model(img.to(self.device))
+        if isinstance(y, torch.Tensor):  # 'cat'
+            return [y]
+        return [y[0]] if self.output == 'grid' else list(y)  # 'grid' is (pred, logits, x)
+
+
+class OnnxRuntimeBackend(Backend):
+    def __init__(self, w, device):
+        import onnxruntime  # onnxruntime or onnxruntime-gpu
+        providers = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if device.type != 'cpu' else ['CPUExecutionProvider']
+        self.session = onnxruntime.InferenceSession(str(w), providers=providers)
+        self.input = self.session.get_inputs()[0].name
+        meta = self.session.get_modelmeta().custom_metadata_map
+        super().__init__({k: json.loads(v) for k, v in meta.items()}, device)
+
+    def forward(self, img):
+        return [torch.from_numpy(y) for y in self.session.run(None, {self.input: img.cpu().numpy()})]
+
+
+class DnnBackend(Backend):
+    def __init__(self, w, device):
+        import cv2
+        check_requirements(('onnx',))  # metadata only, inference runs in OpenCV
+        import onnx
+        meta = {x.key: json.loads(x.value) for x in onnx.load(str(w)).metadata_props}
+        self.net = cv2.dnn.readNetFromONNX(str(w))
+        super().__init__(meta, device)
+
+    def forward(self, img):
+        self.net.setInput(img.cpu().numpy())
+        names = ['output'] if self.output == 'grid' else self.net.getUnconnectedOutLayersNames()
+        return [torch.from_numpy(y) for y in self.net.forward(names)]
+
+
+def load_backend(weights, device, onnx='auto'):
+    # Loads *.torchscript with TorchScript and *.onnx with ONNX Runtime, or OpenCV DNN when onnx='dnn' (or 'auto' and
+    # onnxruntime is not installed)
+    w = Path(weights[0] if isinstance(weights, (list, tuple)) else weights)
+    if w.suffix == '.torchscript':
+        return TorchScriptBackend(w, device)
+    if onnx == 'auto':
+        try:
+            import onnxruntime  # noqa: F401
+            onnx = 'onnxruntime'
+        except ImportError:
+            onnx = 'dnn'
+    return OnnxRuntimeBackend(w, device) if onnx == 'onnxruntime' else DnnBackend(w, device)
@@ -412,7 +412,10 @@ class autoShape(nn.Module):
 
         t = [time_synchronized()]
         p = next(self.model.parameters())  # for device and type
+        fold = getattr(self.model, 'input_fold', None)  # Model.fold_input() takes 0-255 input, BGR if 'bgr'
         if isinstance(imgs, torch.Tensor):  # torch
+            if fold:
+                imgs = (imgs.flip(1) if fold == 'bgr' else imgs) * 255.
             with amp.autocast(enabled=p.device.type != 'cpu'):
                 return self.model(imgs.to(p.device).type_as(p), augment, profile)  # inference
 
@@ -437,8 +440,10 @@ class autoShape(nn.Module):
         shape1 = [make_divisible(x, int(self.stride.max())) for x in np.stack(shape1, 0).max(0)]  # inference shape
         x = [letterbox(im, new_shape=shape1, auto=False)[0] for im in imgs]  # pad
         x = np.stack(x, 0) if n > 1 else x[0][None]  # stack
-        x = np.ascontiguousarray(x.transpose((0, 3, 1, 2)))  # BHWC to BCHW
-        x = torch.from_numpy(x).to(p.device).type_as(p) / 255.  # uint8 to fp16/32
+        x = np.ascontiguousarray((x[..., ::-1] if fold == 'bgr' else x).transpose((0, 3, 1, 2)))  # BHWC to BCHW
+        x = torch.from_numpy(x).to(p.device).type_as(p)  # uint8 to fp16/32
+        if not fold:
+            x /= 255.  # 0 - 255 to 0.0 - 1.0
         t.append(time_synchronized())
 
         with amp.autocast(enabled=p.device.type != 'cpu'):
@@ -580,12 +585,10 @@ class SELayer(nn.Module):
 # -------------------------------------------------------------------------
 
 def channel_shuffle(x, groups):
-    batchsize, num_channels, height, width = x.data.size()
-    channels_per_group = num_channels // groups
+    batchsize, height, width = x.shape[0], x.shape[2], x.shape[3]  # indexed, not unpacked, so torch.fx can trace it
 
     # reshape
-    x = x.view(batchsize, groups,
-               channels_per_group, height, width)
+    x = x.view(batchsize, groups, -1, height, width)
 
     x = torch.transpose(x, 1, 2).contiguous()
 
@@ -1,5 +1,8 @@
 # YOLOv5 experimental modules
 
+import threading
+from pathlib import Path
+
 import numpy as np
 import torch
 import torch.nn as nn
@@ -114,9 +117,15 @@ def attempt_load(weights, map_location=None):
     # Loads an ensemble of models weights=[a,b,c] or a single model weights=[a] or weights=a
     model = Ensemble()
     for w in weights if isinstance(weights, list) else [weights]:
+        if str(w).endswith('.yaml'):  # save_deploy() checkpoint, already fused
+            model.append(load_deploy(w, map_location))
+            continue
         attempt_download(w)
         ckpt = torch.load(w, map_location=map_location)  # load
-        model.append(ckpt['ema' if ckpt.get('ema') else 'model'].float().fuse().eval())  # FP32 model
+        if ckpt.get('quantized'):  # save_quantized() checkpoint, int8 and already fused
+            model.append(load_quantized(ckpt))
+        else:
+            model.append(ckpt['ema' if ckpt.get('ema') else 'model'].float().fuse().eval())  # FP32 model
 
     # Compatibility updates
     for m in model.modules():
@@ -133,3 +142,158 @@ def attempt_load(weights, map_location=None):
         for k in ['names', 'stride']:
             setattr(model, k, getattr(model[-1], k))
         return model  # return ensemble
+
+
+class QuantBody(nn.Module):
+    # Model layers up to (not including) Detect(), returns the Detect() inputs. Traced and quantized by torch.fx
+    def __init__(self, model):
+        super(QuantBody, self).__init__()
+        self.model = model.model[:-1]
+        self.save = model.save
+        self.f = model.model[-1].f  # Detect() input layers
+
+    def forward(self, x):
+        y = []  # outputs
+        for m in self.model:
+            if m.f != -1:  # if not from previous layer
+                x = y[m.f] if isinstance(m.f, int) else [x if j == -1 else y[j] for j in m.f]  # from earlier layers
+            x = m(x)  # run
+            y.append(x if m.i in self.save else None)  # save output
+        return [x if j == -1 else y[j] for j in self.f]
+
+
+class QuantizedModel(nn.Module):
+    # Post-training static int8 model for CPU inference. Backbone and neck are quantized, Detect() stays float so
+    # outputs, grid decoding and post-processing are unchanged. Built by quantize_model(), saved by save_quantized()
+    # and loaded by attempt_load()
+    def __init__(self, body, detect, names, stride, yaml, engine='fbgemm'):
+        super(QuantizedModel, self).__init__()
+        self.body, self.detect = body, detect
+        self.names, self.stride, self.yaml, self.engine = names, stride, yaml, engine
+
+    def forward(self, x, augment=False, profile=False):
+        return self.detect(list(self.body(x)))  # body outputs are dequantized
+
+
+def quantize_model(model, images, engine='fbgemm'):
+    # Returns a QuantizedModel of fused FP32 model (attempt_load) with int8 ranges calibrated on images, an iterable of
+    # (1,3,h,w) FP32 0-1 tensors. engine: 'fbgemm' (x86) or 'qnnpack' (ARM). Requires torch>=1.13
+    from copy import deepcopy
+    from torch.ao.quantization.quantize_fx import convert_fx
+
+    model = deepcopy(model).float().cpu().eval()
+    images = iter(images)
+    img = next(images)
+    body = _prepare_quant(model, engine, img)
+    with torch.no_grad():
+        body(img)
+        for img in images:  # observe activation ranges
+            body(img)
+    return QuantizedModel(convert_fx(body), model.model[-1], model.names, model.stride, model.yaml, engine).eval()
+
+
+def _prepare_quant(model, engine, img):
+    # Returns the observed (prepare_fx) QuantBody of fused FP32 model
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx
+
+    torch.backends.quantized.engine = engine
+    return prepare_fx(QuantBody(model), get_default_qconfig_mapping(engine), example_inputs=(img,))
+
+
+def save_quantized(model, f):
+    # Saves QuantizedModel as f: architecture yaml, names, engine and the int8 state_dict. The FX graph itself is not
+    # pickled (it does not unpickle reliably across processes), load_quantized() rebuilds it
+    torch.save({'model': model.state_dict(), 'yaml': model.yaml, 'names': list(model.names), 'engine': model.engine,
+                'quantized': True}, f)
+
+
+def load_quantized(ckpt):
+    # Rebuilds the QuantizedModel of a save_quantized() checkpoint: the fused FP32 structure from yaml is quantized
+    # with the saved engine (same graph as quantize_model()), then the int8 weights and ranges are loaded
+    from torch.ao.quantization.quantize_fx import convert_fx
+    from models.yolo import Model
+
+    model = Model(ckpt['yaml'], verbose=False).fuse(verbose=False).eval()
+    img = torch.zeros(1, 3, 2 * int(model.stride.max()), 2 * int(model.stride.max()))
+    body = _prepare_quant(model, ckpt['engine'], img)
+    with torch.no_grad():
+        body(img)  # observers need one pass, their ranges are overwritten by the state_dict
+    qmodel = QuantizedModel(convert_fx(body), model.model[-1], ckpt['names'], model.stride, model.yaml, ckpt['engine'])
+    qmodel.load_state_dict(ckpt['model'])
+    return qmodel.eval()
+
+
+def save_deploy(model, f):
+    # Saves fused model for fast loading as f (*.yaml: architecture, names and tensor index) and f with a .bin suffix
+    # (every state_dict tensor, 64-byte aligned, raw). Load with attempt_load(f) or load_deploy(f)
+    import yaml
+
+    assert hasattr(model, 'yaml') and not isinstance(model, QuantizedModel), 'save_deploy() needs a single FP Model'
+    f, index, offset = Path(f), [], 0
+    with open(f.with_suffix('.bin'), 'wb') as fb:
+        for k, v in model.state_dict().items():
+            a = v.detach().cpu().contiguous().numpy()
+            pad = -offset % 64
+            fb.write(b'\0' * pad)
+            index.append([k, a.dtype.name, list(a.shape), offset + pad])
+            fb.write(a.tobytes())
+            offset += pad + a.nbytes
+    meta = {'model': model.yaml, 'names': list(model.names), 'input_fold': model.input_fold,
+            'class_ids': model.class_ids, 'tensors': index}
+    with open(f, 'w') as fy:
+        yaml.safe_dump(meta, fy, sort_keys=False)
+
+
+def load_deploy(f, map_location=None):
+    # Loads a save_deploy() checkpoint: rebuilds the fused architecture from yaml and copies the weights out of the
+    # memory-mapped .bin, no unpickling, thop profiling or model summary
+    import yaml
+    from models.yolo import Model
+
+    with open(f) as fy:
+        meta = yaml.load(fy, Loader=yaml.SafeLoader)
+    model = Model(meta['model'], verbose=False).fuse(verbose=False)  # fused structure, weights are overwritten below
+    data = np.memmap(Path(f).with_suffix('.bin'), dtype=np.uint8, mode='c')  # copy-on-write, tensors stay writable
+    state = {}
+    for k, dtype, shape, offset in meta['tensors']:
+        dtype = np.dtype(dtype)
+        n = int(np.prod(shape)) * dtype.itemsize
+        state[k] = torch.from_numpy(data[offset:offset + n].view(dtype).reshape(shape))
+    model.load_state_dict(state)
+    model.names, model.input_fold, model.class_ids = meta['names'], meta['input_fold'], meta.get('class_ids')
+    return (model.to(map_location) if map_location else model).eval()
+
+
+_resident = {}  # process-wide loaded models, (weights, device, half, fold, classes, onnx) -> model
+_resident_lock = threading.Lock()
+
+
+def load_resident(weights, device, half=False, imgsz=640, onnx='auto', fold=False, classes=None):
+    # Returns the resident model for (weights, device, half, fold, classes, onnx), loading, fusing and warming it up
+    # only on first use. *.torchscript / *.onnx weights load as a models.backends.Backend (onnx: 'auto', 'onnxruntime'
+    # or 'dnn'). fold applies Model.fold_input() and classes Model.keep_classes() where supported, check
+    # model.input_fold and model.class_ids for the input the model expects and the classes it outputs
+    from models.backends import is_exported, load_backend
+
+    classes = (classes,) if isinstance(classes, int) else tuple(classes) if classes else None
+    exported = is_exported(weights)
+    key = (tuple(weights) if isinstance(weights, list) else weights, str(device), half, fold, classes,
+           onnx if exported else None)  # onnx picks the runtime of exported weights only
+    with _resident_lock:
+        if key not in _resident:
+            if exported:
+                model = load_backend(weights, device, onnx)
+                model(torch.zeros(model.batch, 3, *model.imgsz))  # run once
+            else:
+                model = attempt_load(weights, map_location=device)  # load FP32 model
+                if fold and hasattr(model, 'fold_input'):
+                    model.fold_input()  # BGR 0-255 input
+                if classes and hasattr(model, 'keep_classes'):
+                    model.keep_classes(classes)  # outputs classes only, as 0..len(classes)-1
+                if half:
+                    model.half()  # to FP16
+                if device.type != 'cpu':
+                    model(torch.zeros(1, 3, imgsz, imgsz).to(device).type_as(next(model.parameters())))  # run once
+            _resident[key] = model
+        return _resident[key]
@@ -12,8 +12,8 @@ from models.common import *
 from models.experimental import *
 from utils.autoanchor import check_anchor_order
 from utils.general import make_divisible, check_file, set_logging
-from utils.torch_utils import time_synchronized, fuse_conv_and_bn, model_info, scale_img, initialize_weights, \
-    select_device, copy_attr
+from utils.torch_utils import time_synchronized, fuse_conv_and_bn, fuse_convs_and_bn, model_info, scale_img, \
+    initialize_weights, select_device, copy_attr
 
 try:
     import thop  # for FLOPS computation
@@ -37,8 +37,10 @@ class Detect(nn.Module):
         self.register_buffer('anchor_grid', a.clone().view(self.nl, 1, -1, 1, 1, 2))  # shape(nl,1,na,1,1,2)
         self.m = nn.ModuleList(nn.Conv2d(x, self.no * self.na, 1) for x in ch)  # output conv
 
-    def forward(self, x):
+    def forward(self, x, sparse_thres=None):  # sparse_thres: inference objectness threshold, see sparse_forward()
         # x = x.copy()  # for profiling
+        if sparse_thres and not (self.training or self.export or torch.onnx.is_in_onnx_export()):
+            return self.sparse_forward(x, sparse_thres)
         z = []  # inference output
         logits_ = []
         self.training |= self.export
@@ -67,6 +69,27 @@ class Detect(nn.Module):
 
         return x if self.training else (torch.cat(z, 1), torch.cat(logits_, 1), x)
 
+    def sparse_forward(self, x, sparse_thres):
+        # Inference output like forward() with logits None, but only cells whose objectness logit exceeds the inverse
+        # sigmoid of sparse_thres are gathered and decoded. z is (bs,n,no) zero-padded to the largest per-image count,
+        # exactly the rows non_max_suppression(conf_thres=sparse_thres) keeps as candidates, in forward() order
+        t = math.log(sparse_thres / (1 - sparse_thres))  # objectness logit threshold
+        z, img = [], []
+        for i in range(self.nl):
+            x[i] = self.m[i](x[i])  # conv
+            bs, _, ny, nx = x[i].shape  # x(bs,255,20,20) to x(bs,3,20,20,85)
+            x[i] = x[i].view(bs, self.na, self.no, ny, nx).permute(0, 1, 3, 4, 2).contiguous()
+
+            b, a, gy, gx = (x[i][..., 4] > t).nonzero(as_tuple=True)  # candidate cells
+            y = x[i][b, a, gy, gx].sigmoid()  # (n,no)
+            xy = (y[:, 0:2] * 2. - 0.5 + torch.stack((gx, gy), 1)) * self.stride[i]  # xy
+            wh = (y[:, 2:4] * 2) ** 2 * self.anchor_grid[i].view(-1, 2)[a]  # wh
+            z.append(torch.cat((xy, wh, y[:, 4:]), 1))
+            img.append(b)
+        z, img = torch.cat(z), torch.cat(img)
+        z = nn.utils.rnn.pad_sequence([z[img == j] for j in range(bs)], batch_first=True)  # (bs,n,no)
+        return z, None, x
+
     def cat_forward(self, x):
         z = []  # inference output
         for i in range(self.nl):
@@ -88,7 +111,10 @@ class Detect(nn.Module):
         return torch.stack((xv, yv), 2).view((1, 1, ny, nx, 2)).float()
 
 class Model(nn.Module):
-    def __init__(self, cfg='yolov5s.yaml', ch=3, nc=None, anchors=None):  # model, input channels, number of classes
+    input_fold = None  # 'bgr' or 'rgb' once fold_input() made the model take 0-255 input in that channel order
+    class_ids = None  # original class indices of the classes kept by keep_classes()
+
+    def __init__(self, cfg='yolov5s.yaml', ch=3, nc=None, anchors=None, verbose=True):  # model, input channels, number of classes
         super(Model, self).__init__()
         if isinstance(cfg, dict):
             self.yaml = cfg  # model dict
@@ -106,7 +132,7 @@ class Model(nn.Module):
         if anchors:
             logger.info(f'Overriding model.yaml anchors with anchors={anchors}')
             self.yaml['anchors'] = round(anchors)  # override yaml value
-        self.model, self.save = parse_model(deepcopy(self.yaml), ch=[ch])  # model, savelist
+        self.model, self.save = parse_model(deepcopy(self.yaml), ch=[ch], verbose=verbose)  # model, savelist
         self.names = [str(i) for i in range(self.yaml['nc'])]  # default names
         # print([x.shape for x in self.forward(torch.zeros(1, ch, 64, 64))])
 
@@ -123,30 +149,42 @@ class Model(nn.Module):
 
         # Init weights, biases
         initialize_weights(self)
-        self.info()
-        logger.info('')
+        if verbose:
+            self.info()
+            logger.info('')
 
-    def forward(self, x, augment=False, profile=False):
+    def forward(self, x, augment=False, profile=False, sparse_thres=None):  # sparse_thres: see Detect.sparse_forward()
         if augment:
-            img_size = x.shape[-2:]  # height, width
-            s = [1, 0.83, 0.67]  # scales
-            f = [None, 3, None]  # flips (2-ud, 3-lr)
-            y = []  # outputs
-            for si, fi in zip(s, f):
-                xi = scale_img(x.flip(fi) if fi else x, si, gs=int(self.stride.max()))
-                yi = self.forward_once(xi)[0]  # forward
-                # cv2.imwrite(f'img_{si}.jpg', 255 * xi[0].cpu().numpy().transpose((1, 2, 0))[:, :, ::-1])  # save
-                yi[..., :4] /= si  # de-scale
-                if fi == 2:
-                    yi[..., 1] = img_size[0] - yi[..., 1]  # de-flip ud
-                elif fi == 3:
-                    yi[..., 0] = img_size[1] - yi[..., 0]  # de-flip lr
-                y.append(yi)
-            return torch.cat(y, 1), None  # augmented inference, train
+            return self.forward_augment(x, sparse_thres)  # augmented inference, train
         else:
-            return self.forward_once(x, profile)  # single-scale inference, train
-
-    def forward_once(self, x, profile=True):
+            return self.forward_once(x, profile, sparse_thres)  # single-scale inference, train
+
+    def forward_augment(self, x, sparse_thres=None):
+        # Test-time augmentation: the scaled and flipped variants are padded onto one stride-aligned canvas and run as a
+        # single batch, outputs are de-scaled and de-flipped together
+        img_size = x.shape[-2:]  # height, width
+        s = [1, 0.83, 0.67]  # scales
+        f = [None, 3, None]  # flips (2-ud, 3-lr)
+        gs = int(self.stride.max())
+        value = 0.447 * 255 if self.input_fold else 0.447  # pad in the model's input range
+        canvas = x.new_full((len(s), *x.shape[:2], *[make_divisible(d, gs) for d in img_size]), value)
+        for i, (si, fi) in enumerate(zip(s, f)):
+            xi = scale_img(x.flip(fi) if fi else x, si, same_shape=True, value=value)
+            canvas[i, :, :, :xi.shape[2], :xi.shape[3]] = xi
+        y = self.forward_once(canvas.flatten(0, 1), False, sparse_thres)[0]  # forward
+        y = y.view(len(s), len(x), *y.shape[1:])  # (scale, bs, n, no)
+
+        wh = torch.tensor([[int(img_size[1] * si), int(img_size[0] * si)] for si in s], device=y.device)  # scaled size
+        y[..., 4] *= (y[..., :2] < wh[:, None, None]).all(-1).to(y.dtype)  # drop predictions centred in the padding
+        y[..., :4] /= torch.tensor(s, device=y.device, dtype=y.dtype).view(-1, 1, 1, 1)  # de-scale
+        for i, fi in enumerate(f):
+            if fi == 2:
+                y[i, ..., 1] = img_size[0] - y[i, ..., 1]  # de-flip ud
+            elif fi == 3:
+                y[i, ..., 0] = img_size[1] - y[i, ..., 0]  # de-flip lr
+        return y.transpose(0, 1).flatten(1, 2), None  # (bs, scale * n, no)
+
+    def forward_once(self, x, profile=True, sparse_thres=None):
         y, dt = [], []  # outputs
         for m in self.model:
             if m.f != -1:  # if not from previous layer
@@ -160,7 +198,7 @@ class Model(nn.Module):
                 dt.append((time_synchronized() - t) * 100)
                 print('%10.1f%10.0f%10.1fms %-40s' % (o, m.np, dt[-1], m.type))
 
-            x = m(x)  # run
+            x = m(x, sparse_thres) if sparse_thres and isinstance(m, Detect) else m(x)  # run
             y.append(x if m.i in self.save else None)  # save output
 
         if profile:
@@ -190,8 +228,13 @@ class Model(nn.Module):
 
 # --------------------------repvgg & shuffle refuse---------------------------------
 
-    def fuse(self):  # fuse model Conv2d() + BatchNorm2d() layers
-        print('Fusing layers... ')
+    def fuse(self, verify=False, verbose=True):  # fuse model Conv2d() + BatchNorm2d() layers, verify: compare every layer's output
+        if verbose:
+            print('Fusing layers... ')
+        if verify:
+            training = self.training
+            img = torch.rand(1, self.yaml.get('ch', 3), 256, 256, device=next(self.parameters()).device)
+            y0 = self.eval()._layer_outputs(img)
         for m in self.model.modules():
             # print(m)
             if type(m) is RepVGGBlock:
@@ -267,11 +310,83 @@ class Model(nn.Module):
                     # pdb.set_trace()
                     m.branch2 = re_branch2
                     # print(m.branch2)
-        self.info()
+
+            if type(m) in (DWConvblock, MBConvBlock):  # conv / bn attribute pairs, bn becomes a no-op
+                for c, b in (('conv1', 'bn1'), ('conv2', 'bn2')) if type(m) is DWConvblock else \
+                        (('_depthwise_conv', '_bn1'), ('_project_conv', '_bn2')):
+                    if type(getattr(m, b)) is nn.BatchNorm2d:
+                        setattr(m, c, fuse_conv_and_bn(getattr(m, c), getattr(m, b)))
+                        setattr(m, b, nn.Identity())
+
+            if type(m) is BottleneckCSP and type(m.bn) is nn.BatchNorm2d:  # bn(cat(cv3, cv2))
+                m.cv3, m.cv2 = fuse_convs_and_bn((m.cv3, m.cv2), m.bn)
+                m.bn = nn.Identity()
+
+            if type(m) is MixConv2d and type(m.bn) is nn.BatchNorm2d:  # bn(cat(m))
+                m.m = nn.ModuleList(fuse_convs_and_bn(m.m, m.bn))
+                m.bn = nn.Identity()
+
+            if type(m) is nn.Sequential:  # conv_bn_relu_maxpool, stem, mobilev3_bneck, ES_Bottleneck, ...
+                for i in range(len(m) - 1):
+                    if type(m[i]) is nn.Conv2d and type(m[i + 1]) is nn.BatchNorm2d:
+                        m[i], m[i + 1] = fuse_conv_and_bn(m[i], m[i + 1]), nn.Identity()
+
+        if verify:
+            y1 = self._layer_outputs(img)
+            for i, m in enumerate(self.model):
+                d = max(float((a - b).abs().max() / a.abs().max().clamp(min=1)) for a, b in zip(y0[i], y1[i]))
+                (logger.info if d < 1E-4 else logger.warning)(f'{i:>3} {m.type:<40} fused max relative error {d:.2e}')
+            self.train(training)
+        if verbose:
+            self.info()
         return self
 
+    def _layer_outputs(self, x):  # output tensors of every self.model layer for input x
+        y, hooks = {}, []
+
+        def flatten(o):
+            return [o.detach().clone()] if isinstance(o, torch.Tensor) else [t for v in o for t in flatten(v)]
+
+        for m in self.model:
+            hooks.append(m.register_forward_hook(lambda m, i, o: y.__setitem__(m.i, flatten(o))))
+        with torch.no_grad():
+            self.forward_once(x, profile=False)
+        for h in hooks:
+            h.remove()
+        return y
+
 # --------------------------end repvgg & shuffle refuse--------------------------------
 
+    def fold_input(self, bgr=True):  # fold /255 (and BGR to RGB if bgr) into the input convolutions of the first layer
+        if self.input_fold:
+            return self
+        m = self.model[0]
+        assert isinstance(m, (Focus, Conv, CBH, conv_bn_relu_maxpool, stem, RepVGGBlock)), \
+            f'fold_input() does not support a {type(m).__name__} first layer'
+        c1 = 4 * 3 if isinstance(m, Focus) else 3  # Focus() concatenates 4 pixel phases of 3 channels
+        for c in m.modules():
+            if isinstance(c, nn.Conv2d) and c.in_channels == c1 and c.groups == 1:  # every conv that reads the input
+                w = c.weight.data / 255.0  # 0-255 input
+                if bgr:  # reverse each phase's 3 input channels
+                    w = w.view(w.shape[0], c1 // 3, 3, *w.shape[2:]).flip(2).view_as(w)
+                c.weight.data = w
+        self.input_fold = 'bgr' if bgr else 'rgb'
+        return self
+
+    def keep_classes(self, classes):  # prune the Detect() head outputs to box, obj and classes, remaps names
+        m = self.model[-1]  # Detect()
+        keep = torch.tensor(list(range(5)) + [5 + int(c) for c in classes])  # per anchor outputs to keep
+        i = (torch.arange(m.na)[:, None] * m.no + keep).view(-1)  # output channels, (na,no) layout
+        for j, conv in enumerate(m.m):
+            c = nn.Conv2d(conv.in_channels, len(i), conv.kernel_size, conv.stride, conv.padding).to(conv.weight.device)
+            c.weight.data, c.bias.data = conv.weight.data[i].clone(), conv.bias.data[i].clone()
+            m.m[j] = c
+        m.nc = self.yaml['nc'] = len(classes)
+        m.no = m.nc + 5
+        self.class_ids = [int(c) for c in classes] if self.class_ids is None else [self.class_ids[c] for c in classes]
+        self.names = [self.names[c] for c in classes]
+        return self
+
     def nms(self, mode=True):  # add or remove NMS module
         present = type(self.model[-1]) is NMS  # last layer is NMS
         if mode and not present:
@@ -289,15 +404,16 @@ class Model(nn.Module):
     def autoshape(self):  # add autoShape module
         print('Adding autoShape... ')
         m = autoShape(self)  # wrap model
-        copy_attr(m, self, include=('yaml', 'nc', 'hyp', 'names', 'stride'), exclude=())  # copy attributes
+        copy_attr(m, self, include=('yaml', 'nc', 'hyp', 'names', 'stride', 'input_fold'), exclude=())  # copy attributes
         return m
 
     def info(self, verbose=False, img_size=640):  # print model information
         model_info(self, verbose, img_size)
 
 
-def parse_model(d, ch):  # model_dict, input_channels(3)
-    logger.info('\n%3s%18s%3s%10s  %-40s%-30s' % ('', 'from', 'n', 'params', 'module', 'arguments'))
+def parse_model(d, ch, verbose=True):  # model_dict, input_channels(3)
+    log = logger.info if verbose else lambda *args: None
+    log('\n%3s%18s%3s%10s  %-40s%-30s' % ('', 'from', 'n', 'params', 'module', 'arguments'))
     anchors, nc, gd, gw = d['anchors'], d['nc'], d['depth_multiple'], d['width_multiple']
     na = (len(anchors[0]) // 2) if isinstance(anchors, list) else anchors  # number of anchors
     no = na * (nc + 5)  # number of outputs = anchors * (classes + 5)
@@ -345,7 +461,7 @@ def parse_model(d, ch):  # model_dict, input_channels(3)
         t = str(m)[8:-2].replace('__main__.', '')  # module type
         np = sum([x.numel() for x in m_.parameters()])  # number params
         m_.i, m_.f, m_.type, m_.np = i, f, t, np  # attach index, 'from' index, type, number params
-        logger.info('%3s%18s%3s%10.0f  %-40s%-30s' % (i, f, n, np, t, args))  # print
+        log('%3s%18s%3s%10.0f  %-40s%-30s' % (i, f, n, np, t, args))  # print
         save.extend(x % i for x in ([f] if isinstance(f, int) else f) if x != -1)  # append to savelist
         layers.append(m_)
         if i == 0:
@@ -358,6 +474,7 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--cfg', type=str, default='yolov5s.yaml', help='model.yaml')
     parser.add_argument('--device', default='', help='cuda device, i.e. 0 or 0,1,2,3 or cpu')
+    parser.add_argument('--fuse-check', action='store_true', help='fuse and compare every layer with the unfused model')
     opt = parser.parse_args()
     opt.cfg = check_file(opt.cfg)  # check file
     set_logging()
@@ -367,6 +484,9 @@ if __name__ == '__main__':
     model = Model(opt.cfg).to(device)
     model.train()
 
+    if opt.fuse_check:  # numerical equivalence of every fused block
+        model.eval().fuse(verify=True)
+
     # Profile
     # img = torch.rand(8 if torch.cuda.is_available() else 1, 3, 640, 640).to(device)
     # y = model(img, profile=True)
@@ -0,0 +1,79 @@
+"""Post-training static int8 quantization of a YOLOv5-Lite *.pt model for CPU inference
+
+Usage:
+    $ python quantize.py --weights weights/v5lite-s.pt --source test-100-images-input --img 320 --data data/coco128.yaml
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import torch
+import yaml
+
+import test  # import test.py to get mAP
+from models.experimental import attempt_load, quantize_model, save_quantized
+from utils.datasets import LoadImages, create_dataloader
+from utils.general import check_dataset, check_file, check_img_size, colorstr, set_logging
+
+
+def calibration_images(source, imgsz, stride, n):
+    # Yields up to n letterboxed (1,3,h,w) FP32 0-1 tensors from a directory of representative frames
+    for i, (_, img, _, _) in enumerate(LoadImages(source, img_size=imgsz, stride=stride, auto=False)):
+        if i == n:
+            break
+        yield torch.from_numpy(img).float().div(255.0)[None]
+
+
+def benchmark(model, imgsz, n=50):
+    # Returns the mean CPU forward time (ms) at imgsz x imgsz
+    img = torch.zeros(1, 3, imgsz, imgsz)
+    with torch.no_grad():
+        for _ in range(5):  # warmup
+            model(img)
+        t = time.perf_counter()
+        for _ in range(n):
+            model(img)
+    return (time.perf_counter() - t) / n * 1E3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str, default='weights/v5lite-s.pt', help='FP32 model.pt path')
+    parser.add_argument('--source', type=str, default='test-100-images-input', help='calibration images directory')
+    parser.add_argument('--img-size', type=int, default=320, help='inference size (pixels)')
+    parser.add_argument('--calib', type=int, default=100, help='max number of calibration images')
+    parser.add_argument('--engine', default='fbgemm', choices=['fbgemm', 'qnnpack'], help='fbgemm for x86, qnnpack for ARM')
+    parser.add_argument('--data', type=str, default='', help='*.yaml dataset to report the mAP delta on (optional)')
+    parser.add_argument('--batch-size', type=int, default=16, help='mAP batch size')
+    opt = parser.parse_args()
+    print(opt)
+    set_logging()
+
+    model = attempt_load(opt.weights, map_location='cpu')  # fused FP32 model
+    stride = int(model.stride.max())
+    imgsz = check_img_size(opt.img_size, s=stride)
+
+    # Quantize
+    t = time.time()
+    qmodel = quantize_model(model, calibration_images(opt.source, imgsz, stride, opt.calib), opt.engine)
+    f = opt.weights.replace('.pt', '-int8.pt')
+    save_quantized(qmodel, f)
+    print(f'\nQuantized model saved as {f} ({time.time() - t:.1f}s, {Path(f).stat().st_size / 1E6:.1f} MB)')
+
+    # Speed
+    t_fp32, t_int8 = benchmark(model, imgsz), benchmark(qmodel, imgsz)
+    print(f'{colorstr("Speed:")} FP32 {t_fp32:.1f} ms, int8 {t_int8:.1f} ms, {t_fp32 / t_int8:.2f}x at {imgsz}x{imgsz}')
+
+    # mAP
+    if opt.data:
+        with open(check_file(opt.data)) as fd:
+            data = yaml.load(fd, Loader=yaml.SafeLoader)
+        check_dataset(data)
+        dataloader = create_dataloader(data['val'], imgsz, opt.batch_size, stride, argparse.Namespace(single_cls=False),
+                                       pad=0.5, rect=True, prefix=colorstr('val: '))[0]
+        maps = [test.test(data, batch_size=opt.batch_size, imgsz=imgsz, model=m, dataloader=dataloader, plots=False,
+                          half_precision=False)[0][2:4] for m in (model, qmodel)]
+        (a50, a), (b50, b) = maps
+        print(f'{colorstr("mAP@.5:")} FP32 {a50:.4f}, int8 {b50:.4f} ({b50 - a50:+.4f})')
+        print(f'{colorstr("mAP@.5:.95:")} FP32 {a:.4f}, int8 {b:.4f} ({b - a:+.4f})')
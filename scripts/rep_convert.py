@@ -1,7 +1,7 @@
 import torch
 from thop import profile
 from copy import deepcopy
-from models.experimental import attempt_load
+from models.experimental import attempt_load, save_deploy
 
 def model_print(model, img_size):
     # Model information. img_size may be int or list, i.e. img_size=640 or img_size=[640, 320]
@@ -18,11 +18,11 @@ def model_print(model, img_size):
 
 if __name__ == '__main__':
     load = r'F:\Anker\python\YOLOv5-Lite\weights/v5lite-e.pt'
-    save = r'F:\Anker\python\YOLOv5-Lite\weights/repv5lite-e.pt'
+    save = r'F:\Anker\python\YOLOv5-Lite\weights/repv5lite-e.yaml'  # + repv5lite-e.bin, load with attempt_load()
     test_size = 320
     print(f'Done. Befrom weights:({load})')
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     model = attempt_load(load, map_location=device)  # load FP32 model
-    torch.save(model, save)
+    save_deploy(model, save)  # fused, reparameterized weights, no pickle
     model_print(model, test_size)
     print(model)
@@ -6,11 +6,12 @@ import torch
 import torch.backends.cudnn as cudnn
 from numpy import random
 
-from models.experimental import attempt_load
+from models.experimental import load_resident
 from utils.datasets import LoadStreams, LoadImages
 from utils.general import check_img_size, check_requirements, check_imshow, non_max_suppression, apply_classifier, \
     scale_coords, xyxy2xywh, strip_optimizer, set_logging, increment_path
 from utils.plots import plot_one_box
+from utils.sink import MediaSink
 from utils.torch_utils import select_device, load_classifier, time_synchronized
 
 
@@ -33,7 +34,9 @@ class Detect:
                                      update=False, 
                                      view_img=False, 
                                      weights='', 
-                                     read = False)
+                                     read = False,
+                                     sink='block',
+                                     onnx='auto')
        self.width_in_rf = 0
        self.label = ''
        self.KNOWN_DISTANCE = 25.0
@@ -42,6 +45,7 @@ class Detect:
        self.CONFIDENCE_THRESHOLD = 0.4
        self.NMS_THRESHOLD = 0.3
        self.distance = 0
+       self.device = None  # selected once, reused by every detect() call
     
     def focalLength(self, width_in_rf):
         focal_length = (width_in_rf * self.KNOWN_DISTANCE) / self.PERSON_WIDTH
@@ -70,15 +74,16 @@ class Detect:
 
         # Initialize
         set_logging()
-        device = select_device(self.opt.device)
+        if self.device is None:
+            self.device = select_device(self.opt.device)
+        device = self.device
         half = device.type != 'cpu'  # half precision only supported on CUDA
 
-        # Load model
-        model = attempt_load(weights, map_location=device)  # load FP32 model
+        # Load model (resident, shared by every call with the same weights/device/precision)
+        model = load_resident(weights, device, half=half, imgsz=imgsz, onnx=self.opt.onnx)
         stride = int(model.stride.max())  # model stride
-        imgsz = check_img_size(imgsz, s=stride)  # check img_size
-        if half:
-            model.half()  # to FP16
+        auto = getattr(model, 'dynamic', True)  # exported models may have a fixed input shape
+        imgsz = check_img_size(imgsz, s=stride) if auto else model.imgsz  # check img_size
 
         # Second-stage classifier
         classify = False
@@ -87,21 +92,19 @@ class Detect:
             modelc.load_state_dict(torch.load('weights/resnet101.pt', map_location=device)['model']).to(device).eval()
 
         # Set Dataloader
-        vid_path, vid_writer = None, None
+        sink = MediaSink(policy=self.opt.sink)  # image, video and label writes off the inference thread
         if webcam:
             view_img = check_imshow()
             cudnn.benchmark = True  # set True to speed up constant image size inference
-            dataset = LoadStreams(source, img_size=imgsz, stride=stride)
+            dataset = LoadStreams(source, img_size=imgsz, stride=stride, auto=auto)
         else:
-            dataset = LoadImages(source, img_size=imgsz, stride=stride)
+            dataset = LoadImages(source, img_size=imgsz, stride=stride, auto=auto)
 
         # Get names and colors
         names = model.module.names if hasattr(model, 'module') else model.names
         colors = [[random.randint(0, 255) for _ in range(3)] for _ in names]
 
         # Run inference
-        if device.type != 'cpu':
-            model(torch.zeros(1, 3, imgsz, imgsz).to(device).type_as(next(model.parameters())))  # run once
         t0 = time.time()
         for path, img, im0s, vid_cap in dataset:
             img = torch.from_numpy(img).to(device)
@@ -150,12 +153,12 @@ class Detect:
                         s += f"{n} {int(c)} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
 
                     # Write results
+                    lines = ''
                     for *xyxy, conf, cls in reversed(det):
                         if save_txt:  # Write to file
                             xywh = (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()  # normalized xywh
                             line = (cls, *xywh, conf) if self.opt.save_conf else (cls, *xywh)  # label format
-                            with open(txt_path + '.txt', 'a') as f:
-                                f.write(('%g ' * len(line)).rstrip() % line + '\n')
+                            lines += ('%g ' * len(line)).rstrip() % line + '\n'
 
                         if save_img or view_img:  # Add bbox to image
                             label = f'{names[int(cls)]} {conf:.2f}'
@@ -177,6 +180,8 @@ class Detect:
                                     label = f'{names[int(cls)]} {conf:.2f}'
                                 plot_one_box(xyxy, im0, label=label, color=colors[int(cls)], line_thickness=2)
                                 # add the counter
+                    if lines:
+                        sink.labels(txt_path + '.txt', lines)
                     
                             
                             
@@ -196,22 +201,18 @@ class Detect:
                 # Save results (image with detections)
                 if save_img:
                     if dataset.mode == 'image':
-                        cv2.imwrite(save_path, im0)
+                        sink.image(save_path, im0)
                     else:  # 'video' or 'stream'
-                        if vid_path != save_path:  # new video
-                            vid_path = save_path
-                            if isinstance(vid_writer, cv2.VideoWriter):
-                                vid_writer.release()  # release previous video writer
-                            if vid_cap:  # video
-                                fps = vid_cap.get(cv2.CAP_PROP_FPS)
-                                w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                                h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                            else:  # stream
-                                fps, w, h = 30, im0.shape[1], im0.shape[0]
-                                save_path += '.mp4'
-                            vid_writer = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
-                        vid_writer.write(im0)
-
+                        if vid_cap:  # video
+                            fps = vid_cap.get(cv2.CAP_PROP_FPS)
+                            w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                            h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                        else:  # stream
+                            fps, w, h = 30, im0.shape[1], im0.shape[0]
+                            save_path += '.mp4'
+                        sink.video(save_path, im0, fps, w, h)
+
+        sink.close()  # flush pending writes
         if save_txt or save_img:
             s = f"\n{len(list(save_dir.glob('labels/*.txt')))} labels saved to {save_dir / 'labels'}" if save_txt else ''
             print(f"Results saved to {save_dir}{s}")
@@ -227,7 +228,7 @@ class Detect:
         
     def parse_opt(self):
         parser = argparse.ArgumentParser()
-        parser.add_argument('--weights', nargs='+', type=str, default='weights/v5lite-s.pt', help='model.pt path(s)')
+        parser.add_argument('--weights', nargs='+', type=str, default='weights/v5lite-s.pt', help='model.pt, .torchscript or .onnx path(s)')
         parser.add_argument('--source', type=str, default='sample', help='source')  # file/folder, 0 for webcam
         parser.add_argument('--img-size', type=int, default=512, help='inference size (pixels)')
         parser.add_argument('--conf-thres', type=float, default=0.45, help='object confidence threshold')
@@ -245,6 +246,8 @@ class Detect:
         parser.add_argument('--name', default='exp', help='save results to project/name')
         parser.add_argument('--exist-ok', action='store_true', help='existing project/name ok, do not increment')
         parser.add_argument('--read', action='store_true')
+        parser.add_argument('--sink', default='block', choices=MediaSink.policies, help='disk writer policy when its queue is full')
+        parser.add_argument('--onnx', default='auto', choices=['auto', 'onnxruntime', 'dnn'], help='*.onnx weights runtime')
         self.opt = parser.parse_args()
         print(self.opt)
         check_requirements(exclude=('pycocotools', 'thop'))
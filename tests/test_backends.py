@@ -0,0 +1,46 @@
+# Exported TorchScript models run through models.backends like the eager model
+
+import json
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from models.backends import is_exported, load_backend  # noqa: E402
+from models.yolo import Model  # noqa: E402
+
+IMGSZ = 128, 160
+
+
+def build():
+    torch.manual_seed(0)
+    return Model('models/v5Lite-e.yaml', nc=3, verbose=False).fuse(verbose=False).eval()
+
+
+def export(model, f, output, batch=1):
+    # TorchScript export as export.py does it, output 'cat' (--concat) or 'raw'
+    m = model.model[-1]  # Detect()
+    if output == 'cat':
+        m.forward = m.cat_forward
+    m.export = output == 'raw'
+    meta = {'stride': m.stride.tolist(), 'anchors': m.anchor_grid.view(m.nl, -1, 2).tolist(), 'names': model.names,
+            'output': output, 'imgsz': list(IMGSZ), 'batch': batch, 'dynamic': False}
+    ts = torch.jit.trace(model, torch.zeros(batch, 3, *IMGSZ), strict=False)
+    torch.jit.save(ts, str(f), _extra_files={'config.txt': json.dumps(meta)})
+    return str(f)
+
+
+@torch.no_grad()
+@pytest.mark.parametrize('output', ['cat', 'raw'])
+@pytest.mark.parametrize('batch', [1, 2])
+def test_torchscript(tmp_path, output, batch):
+    img = torch.rand(3, 3, *IMGSZ)  # 3 images, the static batch 2 export pads the last chunk
+    ref = build()(img)[0]
+    f = export(build(), tmp_path / 'model.torchscript', output, batch)
+    assert is_exported(f) and is_exported([f]) and not is_exported('model.pt')
+
+    backend = load_backend(f, torch.device('cpu'))
+    assert (backend.batch, backend.imgsz, backend.names) == (batch, IMGSZ, ['0', '1', '2'])
+    pred, _ = backend(img)
+    assert pred.shape == ref.shape
+    assert torch.allclose(pred, ref, rtol=1e-4, atol=1e-3)
@@ -0,0 +1,70 @@
+# Shared CaptureService decoding stride against a fake cv2.VideoCapture
+
+import threading
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+from utils import capture  # noqa: E402
+
+
+class FakeCapture:
+    # n frames, frame i is filled with i. Grabs block on go so a test can subscribe before the stream runs
+    def __init__(self, source, n=40):
+        self.i, self.n, self.retrieved = 0, n, []
+        self.go = threading.Event()
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return 0
+
+    def grab(self):
+        if self.i:
+            self.go.wait()
+        self.i += 1
+        return self.i <= self.n
+
+    def retrieve(self):
+        self.retrieved.append(self.i)
+        return True, np.full((2, 2, 3), self.i, np.uint8)
+
+    def read(self):
+        return self.grab() and self.retrieve()
+
+    def release(self):
+        pass
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    caps = []
+    monkeypatch.setattr(capture.cv2, 'VideoCapture', lambda s: caps.append(FakeCapture(s)) or caps[-1])
+    return caps
+
+
+def frames(sub):
+    seen = []
+    while True:
+        frame = sub.read(timeout=1.0)
+        if frame is None:
+            return seen
+        seen.append(int(frame[0][0, 0, 0]))
+
+
+@pytest.mark.parametrize('strides, decoded', [((4,), list(range(1, 41, 4))),  # every 4th after the first frame
+                                              ((4, 1), list(range(1, 41))),  # finest stride of the subscribers
+                                              ((1,), list(range(1, 41)))])
+def test_stride(fake, strides, decoded):
+    subs = [capture.subscribe('fake', every=s) for s in strides]
+    assert len(fake) == 1  # one device, shared
+    fake[0].go.set()
+    seen = frames(subs[0])
+    assert fake[0].retrieved == decoded
+    assert seen[0] == 1 and set(seen) <= set(decoded) and seen == sorted(seen)
+    for sub in subs:
+        sub.close()
+    assert 'fake' not in capture._services
@@ -0,0 +1,130 @@
+# Inference preprocessing: LetterboxPlan and LetterboxBuffer against the letterbox() reference
+
+import threading
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+torch = pytest.importorskip('torch')
+
+from utils import capture  # noqa: E402
+from utils.datasets import LetterboxBuffer, LoadStreams, letterbox, letterbox_plan  # noqa: E402
+
+
+def frame(h, w, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (h, w, 3), dtype=np.uint8)
+
+
+def reference(ims, img_size=320, stride=32, auto=True, scale=255.0):
+    # (bs,3,h,w) float RGB 0-1 input as LoadImages + detect.py built it
+    img = np.stack([letterbox(im, img_size, stride=stride, auto=auto)[0] for im in ims])
+    return torch.from_numpy(np.ascontiguousarray(img[..., ::-1].transpose(0, 3, 1, 2))).float() / scale
+
+
+@pytest.mark.parametrize('shape', [(480, 640), (640, 480), (720, 1280), (100, 90), (320, 320), (481, 643)])
+@pytest.mark.parametrize('auto', [True, False])
+def test_letterbox_plan(shape, auto):
+    im = frame(*shape)
+    ref, ratio, pad = letterbox(im, 320, stride=32, auto=auto)
+    plan = letterbox_plan(shape, 320, 32, auto)
+    assert plan is letterbox_plan(shape, 320, 32, auto)  # cached
+    assert plan.padded == ref.shape[:2]
+    assert plan.ratio_pad == (ratio, pad)
+    assert np.array_equal(plan.apply(im), ref)
+    dst = np.zeros_like(ref)
+    plan.apply(frame(*shape, 1), dst)
+    assert np.array_equal(plan.apply(im, dst, border=False), ref)  # border kept from the previous frame
+
+
+def test_letterbox_buffer():
+    buffer = LetterboxBuffer(320, 32, auto=True)
+    for shape, seed in [((480, 640), 0), ((480, 640), 1), ((300, 200), 2), ((480, 640), 3)]:  # geometry changes
+        im = frame(*shape, seed)
+        img, plans = buffer([im])
+        assert torch.equal(img, reference([im]))
+        assert plans[0].shape == shape
+
+
+def test_letterbox_buffer_batch():
+    ims = [frame(480, 640, 0), frame(360, 640, 1)]
+    img, plans = LetterboxBuffer(320, 32, auto=False)(ims)  # common square shape
+    assert img.shape == (2, 3, 320, 320)
+    assert torch.equal(img, reference(ims, auto=False))
+
+
+def test_letterbox_buffer_fold():
+    im = frame(240, 320)
+    ref = reference([im], scale=1.0)  # 0-255
+    bgr, _ = LetterboxBuffer(320, fold='bgr')([im])
+    rgb, _ = LetterboxBuffer(320, fold='rgb')([im])
+    assert torch.equal(bgr, ref.flip(1))
+    assert torch.equal(rgb, ref)
+
+
+def test_letterbox_buffer_lease():
+    buffer = LetterboxBuffer(320, slots=2, lease=True)
+    a, _ = buffer([frame(240, 320, 0)])
+    b, _ = buffer([frame(240, 320, 1)])
+    assert a is not b
+    got = []
+    t = threading.Thread(target=lambda: got.append(buffer([frame(240, 320, 2)])[0]))
+    t.start()
+    t.join(0.1)
+    assert t.is_alive()  # both slots leased
+    expected = reference([frame(240, 320, 1)])
+    buffer.release(a)
+    t.join()
+    assert got[0] is a  # the released slot, b untouched
+    assert torch.equal(b, expected)
+
+
+class Camera:
+    # Fake cv2.VideoCapture of n (48,64,3) frames at about 1 kHz, frame i is filled with i
+    def __init__(self, n):
+        self.i, self.n = 0, n
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return 0
+
+    def grab(self):
+        time.sleep(0.001)
+        self.i += 1
+        return self.i <= self.n
+
+    def retrieve(self):
+        return True, np.full((48, 64, 3), self.i, np.uint8)
+
+    def read(self):
+        return self.grab() and self.retrieve()
+
+    def release(self):
+        pass
+
+
+def test_load_streams(tmp_path, monkeypatch):
+    n = {'a': 200, 'b': 20}
+    monkeypatch.setattr(capture.cv2, 'VideoCapture', lambda s: Camera(n[s]))
+    f = tmp_path / 'streams.txt'
+    f.write_text('a\nb\n')
+    dataset = LoadStreams(str(f), img_size=64, stride=32, raw=True)
+
+    last, results = [0, 0], []
+    while any(t.is_alive() for t in dataset.threads):
+        frames = dataset.latest()
+        if frames is None:
+            continue
+        imgs, stamps, ages = frames
+        v = [int(im[0, 0, 0]) for im in imgs]
+        for i in range(2):
+            assert v[i] > last[i] or v[i] == 0  # a new frame, or black once the stream is lost
+            assert v[i] % 4 == 1 or v[i] == 0  # LoadStreams decodes every 4th frame
+        assert all(a >= 0 for a in ages) and len(stamps) == 2
+        last = [x or last[i] for i, x in enumerate(v)]
+        results.append(v)
+    assert any(a and not b for a, b in results)  # 'a' kept running after 'b' dropped
+    assert not capture._services  # both captures released
@@ -0,0 +1,26 @@
+# save_deploy() / load_deploy() round trip of a fused model
+
+import pytest
+
+torch = pytest.importorskip('torch')
+yaml = pytest.importorskip('yaml')
+
+from models.experimental import attempt_load, save_deploy  # noqa: E402
+from models.yolo import Model  # noqa: E402
+
+
+@torch.no_grad()
+@pytest.mark.parametrize('cfg', ['models/v5Lite-e.yaml', 'models/v5Lite-g.yaml'])
+def test_deploy(tmp_path, cfg):
+    torch.manual_seed(0)
+    model = Model(cfg, nc=4, verbose=False).fuse(verbose=False).eval().fold_input().keep_classes([3, 1])
+    f = tmp_path / 'model.yaml'
+    save_deploy(model, f)
+    assert all(offset % 64 == 0 for *_, offset in yaml.safe_load(f.read_text())['tensors'])
+
+    loaded = attempt_load(str(f), map_location='cpu')
+    assert (loaded.names, loaded.input_fold, loaded.class_ids) == (['3', '1'], 'bgr', [3, 1])
+    assert loaded.state_dict().keys() == model.state_dict().keys()
+    assert all(torch.equal(a, b) for a, b in zip(loaded.state_dict().values(), model.state_dict().values()))
+    img = torch.randint(0, 256, (1, 3, 128, 128)).float()
+    assert torch.equal(loaded(img)[0], model(img)[0])
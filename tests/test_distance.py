@@ -0,0 +1,60 @@
+# Focal-length calibration store and vectorized distance estimation
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from utils.distance import CalibrationStore, DistanceEstimator  # noqa: E402
+
+
+def test_calibration_store(tmp_path):
+    ref, weights = tmp_path / 'person.jpg', tmp_path / 'model.pt'
+    ref.write_bytes(b'image')
+    weights.write_bytes(b'weights')
+    path = tmp_path / 'ref' / 'calibration.json'
+
+    store = CalibrationStore(path)
+    key = store.key(str(ref), str(weights), 640, 45.0, 25.0)
+    assert store.get(str(ref), key) is None
+    store.put(str(ref), key, 123.5, 68.6)
+
+    store = CalibrationStore(path)  # reloaded from disk
+    assert store.get(str(ref), key) == (123.5, 68.6)
+    assert store.key(str(ref), str(weights), 640, 45.0, 25.0) == key
+    for k in (store.key(str(ref), str(weights), 320, 45.0, 25.0),  # any changed input invalidates the entry
+              store.key(str(ref), str(weights), 640, 40.0, 25.0),
+              store.key(str(ref), str(weights), 640, 45.0, 30.0)):
+        assert store.get(str(ref), k) is None
+
+    ref.write_bytes(b'another image')  # re-hashed by a new process
+    store = CalibrationStore(path)
+    assert store.get(str(ref), store.key(str(ref), str(weights), 640, 45.0, 25.0)) is None
+
+
+def test_calibration_store_corrupt(tmp_path):
+    path = tmp_path / 'calibration.json'
+    path.write_text('{not json')
+    store = CalibrationStore(path)
+    assert store.data == {}
+    store.put('a.jpg', 'k', 1, 2)
+    assert CalibrationStore(path).get('a.jpg', 'k') == (1.0, 2.0)
+    assert not path.with_suffix('.tmp').exists()
+
+
+def test_distance_estimator():
+    names, focals = ['person', 'dog', 'cat'], {'person': 500.0, 'dog': 300.0}  # no cat calibration
+    det = torch.tensor([[100, 50, 150, 200, 0.9, 0],  # person, 50px wide, left
+                        [290, 10, 350, 90, 0.8, 1],  # dog, 60px wide, center
+                        [500, 0, 600, 100, 0.7, 2],  # cat, right
+                        [0, 0, 625, 10, 0.6, 0]])  # wide person, center
+    out = DistanceEstimator(names, focals, known_distance=25.0, margin=50, near=2.0, far=4.0)(det, width=640)
+
+    for (x1, y1, x2, y2, conf, c), r in zip(det.tolist(), out):  # per box, as the old detect loop did
+        focal = focals.get(names[int(c)])
+        d = focal * 25.0 / (x2 - x1) / 100 if focal else float('inf')
+        cx = (x1 + x2) / 2
+        zone = 0 if cx < 320 - 50 else 2 if cx > 320 + 50 else 1
+        assert r['distance'] == pytest.approx(d)
+        assert (r['zone'], r['cls'], r['near'], r['far']) == (zone, c, d < 2, d >= 4)
+        assert r['conf'] == pytest.approx(conf) and r['xyxy'].tolist() == [x1, y1, x2, y2]
+    assert len(DistanceEstimator(names, focals)(det[:0], 640)) == 0
@@ -0,0 +1,94 @@
+# Inference-time Model / Detect() transforms keep the outputs of the plain forward pass
+
+import logging
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from models.yolo import Model  # noqa: E402
+
+CONFIGS = ['models/v5Lite-s.yaml', 'models/v5Lite-e.yaml', 'models/v5Lite-c.yaml', 'models/v5Lite-g.yaml']
+
+
+def build(cfg='models/v5Lite-e.yaml', nc=3, fuse=True):
+    # Seeded random eval() model of cfg, BatchNorm statistics randomized so fusing them is not a no-op
+    torch.manual_seed(0)
+    model = Model(cfg, nc=nc, verbose=False)
+    for m in model.modules():
+        if isinstance(m, torch.nn.BatchNorm2d):
+            m.running_mean.uniform_(-0.5, 0.5)
+            m.running_var.uniform_(0.5, 2.0)
+            m.weight.data.uniform_(0.5, 1.5)
+            m.bias.data.uniform_(-0.5, 0.5)
+    return (model.fuse(verbose=False) if fuse else model).eval()
+
+
+@torch.no_grad()
+@pytest.mark.parametrize('cfg', CONFIGS)
+@pytest.mark.parametrize('bgr', [True, False])
+def test_fold_input(cfg, bgr):
+    model = build(cfg)
+    im = torch.randint(0, 256, (2, 3, 128, 160)).float()  # 0-255, channel order of the source
+    rgb = im.flip(1) if bgr else im
+    y0 = model(rgb / 255.0)[0]
+    y1 = model.fold_input(bgr=bgr)(im)[0]
+    assert model.input_fold == ('bgr' if bgr else 'rgb')
+    assert torch.allclose(y0, y1, rtol=1e-4, atol=1e-3)
+    assert model.fold_input() is model and torch.allclose(model(im)[0], y1)  # folds once
+
+
+@torch.no_grad()
+@pytest.mark.parametrize('cfg', CONFIGS)
+def test_fuse(cfg, caplog):
+    caplog.set_level(logging.INFO)
+    model = build(cfg, fuse=False)
+    img = torch.rand(1, 3, 128, 160)
+    y0 = model(img)[0]
+    model.fuse(verify=True, verbose=False)
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in model.modules())  # every conv block fused
+    assert torch.allclose(model(img)[0], y0, rtol=1e-4, atol=1e-3)
+    assert 'relative error' in caplog.text and not [r for r in caplog.records if r.levelname == 'WARNING']
+
+
+@torch.no_grad()
+def test_keep_classes():
+    model = build(nc=6)
+    img = torch.rand(2, 3, 128, 160)
+    y0 = model(img)[0]
+    model.keep_classes([4, 1, 2])
+    assert (model.names, model.class_ids, model.model[-1].no) == (['4', '1', '2'], [4, 1, 2], 8)
+    assert torch.allclose(model(img)[0], y0[..., [0, 1, 2, 3, 4, 9, 6, 7]], atol=1e-5)
+    model.keep_classes([2])  # pruning again keeps the original class ids
+    assert (model.names, model.class_ids) == (['2'], [2])
+    assert torch.allclose(model(img)[0], y0[..., [0, 1, 2, 3, 4, 7]], atol=1e-5)
+
+
+@torch.no_grad()
+def test_sparse_forward():
+    model = build()
+    img = torch.rand(2, 3, 160, 128)
+    dense = model(img)[0]
+    obj = dense[..., 4].flatten().sort()[0]
+    thres = float(obj[len(obj) // 2:len(obj) // 2 + 2].mean())  # between two objectness values, about half the cells
+    sparse = model(img, sparse_thres=thres)[0]
+    for d, s in zip(dense, sparse):
+        d = d[d[:, 4] > thres]  # the candidates non_max_suppression(conf_thres=thres) keeps, in forward() order
+        assert torch.allclose(s[:len(d)], d, atol=1e-5)
+        assert not s[len(d):].any()  # zero padding
+    assert torch.equal(model(img)[0], dense)  # the model itself is unchanged
+
+
+@torch.no_grad()
+def test_forward_augment():
+    model = build()
+    img = torch.rand(2, 3, 128, 160)
+    y0 = model(img)[0]
+    y = model(img, augment=True)[0]
+    assert y.shape == (2, 3 * y0.shape[1], y0.shape[2])  # scales 1, 0.83 (lr-flipped), 0.67 on a 128x160 canvas
+    assert torch.allclose(y[:, :y0.shape[1]], y0, atol=1e-5)  # scale 1 is the plain forward
+    assert torch.allclose(torch.cat([model(x[None], augment=True)[0] for x in img]), y, atol=1e-5)  # batched per image
+
+    small = y[:, 2 * y0.shape[1]:]  # 0.67 scale, de-scaled back to input pixels
+    outside = (small[..., 0] > 160) | (small[..., 1] > 128)
+    assert outside.any() and not small[outside][:, 4].any()  # centred in the padding, objectness dropped
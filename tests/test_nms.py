@@ -0,0 +1,146 @@
+# Parity of the batched utils.general.non_max_suppression() with the per-image loop it replaced
+
+import time
+
+import pytest
+
+torch = pytest.importorskip('torch')
+torchvision = pytest.importorskip('torchvision')
+
+from utils.general import box_iou, non_max_suppression, xywh2xyxy  # noqa: E402
+
+
+def non_max_suppression_loop(prediction, conf_thres=0.25, iou_thres=0.45, classes=None, agnostic=False,
+                             multi_label=False, labels=()):
+    # Reference: the per-image loop non_max_suppression() replaced, with its NMS boxes in float64 like the batched one
+
+    nc = prediction.shape[2] - 5  # number of classes
+    xc = prediction[..., 4] > conf_thres  # candidates
+
+    # Settings
+    min_wh, max_wh = 2, 4096  # (pixels) minimum and maximum box width and height
+    max_det = 300  # maximum number of detections per image
+    max_nms = 30000  # maximum number of boxes into torchvision.ops.nms()
+    time_limit = 10.0  # seconds to quit after
+    redundant = True  # require redundant detections
+    multi_label &= nc > 1  # multiple labels per box (adds 0.5ms/img)
+    merge = False  # use merge-NMS
+
+    t = time.time()
+    output = [torch.zeros((0, 6), device=prediction.device)] * prediction.shape[0]
+    for xi, x in enumerate(prediction):  # image index, image inference
+        # Apply constraints
+        # x[((x[..., 2:4] < min_wh) | (x[..., 2:4] > max_wh)).any(1), 4] = 0  # width-height
+        x = x[xc[xi]]  # confidence
+
+        # Cat apriori labels if autolabelling
+        if labels and len(labels[xi]):
+            l = labels[xi]
+            v = torch.zeros((len(l), nc + 5), device=x.device)
+            v[:, :4] = l[:, 1:5]  # box
+            v[:, 4] = 1.0  # conf
+            v[range(len(l)), l[:, 0].long() + 5] = 1.0  # cls
+            x = torch.cat((x, v), 0)
+
+        # If none remain process next image
+        if not x.shape[0]:
+            continue
+
+        # Compute conf
+        x[:, 5:] *= x[:, 4:5]  # conf = obj_conf * cls_conf
+
+        # Box (center x, center y, width, height) to (x1, y1, x2, y2)
+        box = xywh2xyxy(x[:, :4])
+
+        # Detections matrix nx6 (xyxy, conf, cls)
+        if multi_label:
+            i, j = (x[:, 5:] > conf_thres).nonzero(as_tuple=False).T
+            x = torch.cat((box[i], x[i, j + 5, None], j[:, None].float()), 1)
+        else:  # best class only
+            conf, j = x[:, 5:].max(1, keepdim=True)
+            x = torch.cat((box, conf, j.float()), 1)[conf.view(-1) > conf_thres]
+
+        # Filter by class
+        if classes is not None:
+            x = x[(x[:, 5:6] == torch.tensor(classes, device=x.device)).any(1)]
+
+        # Apply finite constraint
+        # if not torch.isfinite(x).all():
+        #     x = x[torch.isfinite(x).all(1)]
+
+        # Check shape
+        n = x.shape[0]  # number of boxes
+        if not n:  # no boxes
+            continue
+        elif n > max_nms:  # excess boxes
+            x = x[x[:, 4].argsort(descending=True)[:max_nms]]  # sort by confidence
+
+        # Batched NMS
+        c = x[:, 5:6] * (0 if agnostic else max_wh)  # classes
+        boxes, scores = x[:, :4].double() + c, x[:, 4].double()  # float64 as in the batched version
+        i = torchvision.ops.nms(boxes, scores, iou_thres)  # NMS
+        if i.shape[0] > max_det:  # limit detections
+            i = i[:max_det]
+        if merge and (1 < n < 3E3):  # Merge NMS (boxes merged using weighted mean)
+            # update boxes as boxes(i,4) = weights(i,n) * boxes(n,4)
+            iou = box_iou(boxes[i], boxes) > iou_thres  # iou matrix
+            weights = iou * scores[None]  # box weights
+            x[i, :4] = torch.mm(weights, x[:, :4]).float() / weights.sum(1, keepdim=True)  # merged boxes
+            if redundant:
+                i = i[iou.sum(1) > 1]  # require redundancy
+
+        output[xi] = x[i]
+        if (time.time() - t) > time_limit:
+            print(f'WARNING: NMS time limit {time_limit}s exceeded')
+            break  # time limit exceeded
+
+    return output
+
+
+def predictions(bs=4, n=2000, nc=80, dtype=torch.float32, seed=0):
+    # (bs,n,5+nc) random xywh boxes in a 640x640 image with random obj and class scores
+    g = torch.Generator().manual_seed(seed)
+    xy = torch.rand(bs, n, 2, generator=g, dtype=dtype) * 640
+    wh = torch.rand(bs, n, 2, generator=g, dtype=dtype) * 60 + 4
+    return torch.cat((xy, wh, torch.rand(bs, n, 1 + nc, generator=g, dtype=dtype)), 2)
+
+
+def assert_same(a, b):
+    assert len(a) == len(b)
+    for x, y in zip(a, b):
+        assert x.shape == y.shape
+        assert torch.allclose(x, y.to(x.dtype), atol=1e-5)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'classes': [0, 2, 5]}, {'agnostic': True}, {'conf_thres': 0.5}])
+def test_single_label(kwargs):
+    pred = predictions()
+    assert_same(non_max_suppression(pred.clone(), **kwargs), non_max_suppression_loop(pred.clone(), **kwargs))
+
+
+def test_multi_label_truncation():
+    # test.py settings, float64 scores so no two candidates tie at the max_nms / max_det cut
+    pred = predictions(bs=3, n=1000, dtype=torch.float64)
+    kwargs = dict(conf_thres=0.001, iou_thres=0.6, multi_label=True)
+    assert ((pred[..., 4:5] * pred[..., 5:] > 0.001).sum((1, 2)) > 30000).all()  # max_nms applies to every image
+    new, old = non_max_suppression(pred.clone(), **kwargs), non_max_suppression_loop(pred.clone(), **kwargs)
+    assert any(len(x) == 300 for x in old)  # max_det applies
+    assert_same(new, old)
+
+
+def test_labels():
+    pred = predictions(bs=3, n=500)
+    g = torch.Generator().manual_seed(1)
+    labels = [torch.cat((torch.randint(0, 80, (n, 1), generator=g).float(),  # (n,5) [cls, xywh]
+                         torch.rand(n, 4, generator=g) * 300 + 20), 1) for n in (5, 0, 2)]  # none for the second image
+    kwargs = dict(conf_thres=0.001, iou_thres=0.6, multi_label=True, labels=labels)
+    assert_same(non_max_suppression(pred.clone(), **kwargs), non_max_suppression_loop(pred.clone(), **kwargs))
+
+
+def test_empty():
+    pred = predictions(bs=2, n=100)
+    pred[0, :, 4] = 0  # no candidates in image 0
+    out = non_max_suppression(pred.clone())
+    assert_same(out, non_max_suppression_loop(pred.clone()))
+    assert out[0].shape == (0, 6)
+    assert [x.shape for x in non_max_suppression(pred[:, :0])] == [(0, 6), (0, 6)]
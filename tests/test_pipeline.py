@@ -0,0 +1,75 @@
+# DropQueue drop behavior and Pipeline ordering, error propagation and release of unused source items
+
+import threading
+import time
+
+import pytest
+
+from utils.pipeline import DropQueue, Pipeline
+
+
+def test_drop_queue_drops_oldest():
+    dropped = []
+    q = DropQueue(maxsize=2, drop=True, on_drop=dropped.append)
+    for i in range(5):
+        q.put(i)
+    q.close()
+    q.put(5)  # after close
+    assert list(q) == [3, 4]
+    assert dropped == [0, 1, 2, 5] and q.dropped == 3
+
+
+def test_drop_queue_blocks():
+    q = DropQueue(maxsize=2, drop=False)
+
+    def produce():
+        for i in range(50):
+            q.put(i)
+        q.close()
+
+    threading.Thread(target=produce, daemon=True).start()
+    assert list(q) == list(range(50)) and q.dropped == 0
+
+
+def test_pipeline_keeps_every_item():
+    out = []
+    assert Pipeline(range(100), lambda x: x * 2, lambda x: None if x % 4 else x, out.append, drop=False).run() \
+        == [0, 0, 0]
+    assert out == list(range(0, 200, 4))
+
+
+def test_pipeline_releases_dropped():
+    produced, taken, released = [], [], []
+
+    def source():
+        for i in range(200):
+            produced.append(i)
+            yield i
+
+    def slow(x):
+        taken.append(x)
+        time.sleep(0.001)
+
+    dropped = Pipeline(source(), slow, maxsize=1, drop=True, release=released.append).run()
+    assert dropped[0] == len(released)
+    assert sorted(taken + released) == produced  # every item reached the stage or was released, once
+
+
+def test_pipeline_error():
+    produced, taken, released = [], [], []
+
+    def source():
+        for i in range(1000):
+            produced.append(i)
+            yield i
+
+    def stage(x):
+        taken.append(x)
+        if x == 10:
+            raise ValueError('stage failed')
+        return x
+
+    with pytest.raises(ValueError, match='stage failed'):
+        Pipeline(source(), stage, lambda x: time.sleep(0.001), drop=False, release=released.append).run()
+    assert len(produced) < 1000  # capture stopped
+    assert sorted(taken + released) == produced
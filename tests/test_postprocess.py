@@ -0,0 +1,63 @@
+# Parity of the NumPy-only utils.postprocess with the torch post-processing it mirrors
+
+import pytest
+
+np = pytest.importorskip('numpy')
+torch = pytest.importorskip('torch')
+pytest.importorskip('torchvision')
+
+from models.backends import Backend  # noqa: E402
+from utils import general, postprocess  # noqa: E402
+
+STRIDE = [8, 16, 32]
+ANCHORS = [[10, 13, 16, 30, 33, 23], [30, 61, 62, 45, 59, 119], [116, 90, 156, 198, 373, 326]]  # pixels
+
+
+def predictions(bs=3, n=1500, nc=80, seed=0):
+    # (bs,n,5+nc) float32 random xywh boxes in a 640x640 image with random obj and class scores
+    rng = np.random.default_rng(seed)
+    xy, wh = rng.random((bs, n, 2)) * 640, rng.random((bs, n, 2)) * 60 + 4
+    return np.concatenate((xy, wh, rng.random((bs, n, 1 + nc))), 2).astype(np.float32)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'classes': [0, 2, 5]}, {'agnostic': True},
+                                    {'conf_thres': 0.001, 'iou_thres': 0.6, 'multi_label': True}])
+def test_non_max_suppression(kwargs):
+    pred = predictions(n=300 if kwargs.get('multi_label') else 1500)
+    new = postprocess.non_max_suppression(pred.copy(), **kwargs)
+    old = general.non_max_suppression(torch.from_numpy(pred.copy()), **kwargs)
+    assert len(new) == len(old)
+    for x, y in zip(new, old):
+        assert x.shape == tuple(y.shape)
+        np.testing.assert_allclose(x, y.numpy(), atol=1e-5)
+
+
+def test_non_max_suppression_empty():
+    pred = predictions(bs=2, n=100)
+    pred[..., 4] = 0
+    assert [x.shape for x in postprocess.non_max_suppression(pred)] == [(0, 6), (0, 6)]
+
+
+@pytest.mark.parametrize('ratio_pad', [None, ((0.5, 0.5), (0.0, 12.0))])
+def test_scale_coords(ratio_pad):
+    rng = np.random.default_rng(0)
+    boxes = (rng.random((50, 4)) * 640).astype(np.float32)
+    boxes[:, 2:] += boxes[:, :2]  # xyxy, some outside the image to exercise clipping
+    new = postprocess.scale_coords((384, 640), boxes.copy(), (720, 1280, 3), ratio_pad)
+    old = general.scale_coords((384, 640), torch.from_numpy(boxes.copy()), (720, 1280, 3), ratio_pad)
+    np.testing.assert_allclose(new, old.numpy(), rtol=1e-6)
+
+
+@pytest.mark.parametrize('output', ['raw', 'cat'])
+def test_decode(output):
+    h, w, na, no = 256, 320, 3, 85
+    rng = np.random.default_rng(0)
+    if output == 'raw':  # per level logits (bs,na,ny,nx,no)
+        y = [rng.standard_normal((2, na, h // s, w // s, no)).astype(np.float32) for s in STRIDE]
+    else:  # concatenated sigmoid outputs (bs,N,no)
+        y = [rng.random((2, na * sum((h // s) * (w // s) for s in STRIDE), no)).astype(np.float32)]
+    backend = Backend({'names': [], 'stride': STRIDE, 'anchors': ANCHORS, 'output': output, 'imgsz': [h, w]},
+                      torch.device('cpu'))
+    new = postprocess.decode(y, output, STRIDE, ANCHORS, h, w)
+    old = backend.decode([torch.from_numpy(x) for x in y], h, w)
+    np.testing.assert_allclose(new, old.numpy(), rtol=1e-5, atol=1e-3)
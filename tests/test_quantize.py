@@ -0,0 +1,26 @@
+# int8 checkpoints written by save_quantized() reload through attempt_load()
+
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('torch.ao.quantization.quantize_fx')
+
+from models.experimental import attempt_load, quantize_model, save_quantized  # noqa: E402
+from models.yolo import Model  # noqa: E402
+
+
+@pytest.mark.skipif('fbgemm' not in torch.backends.quantized.supported_engines, reason='fbgemm not supported')
+def test_save_reload(tmp_path):
+    torch.manual_seed(0)
+    model = Model('models/v5Lite-e.yaml', nc=3, verbose=False).fuse(verbose=False).eval()
+    images = [torch.rand(1, 3, 128, 128) for _ in range(2)]
+    qmodel = quantize_model(model, images, 'fbgemm')
+    f = tmp_path / 'model-int8.pt'
+    save_quantized(qmodel, f)
+
+    loaded = attempt_load(str(f), map_location='cpu')
+    assert loaded.names == qmodel.names
+    with torch.no_grad():
+        y0, y1 = qmodel(images[0])[0], loaded(images[0])[0]
+    assert y1.shape == y0.shape
+    assert torch.allclose(y0, y1)
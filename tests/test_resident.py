@@ -0,0 +1,32 @@
+# load_resident() loads each (weights, device, precision, fold, classes) model once per process
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from models import experimental  # noqa: E402
+from models.yolo import Model  # noqa: E402
+
+
+@pytest.fixture
+def weights(tmp_path, monkeypatch):
+    monkeypatch.setattr(experimental, '_resident', {})
+    torch.manual_seed(0)
+    f = tmp_path / 'model.pt'
+    torch.save({'model': Model('models/v5Lite-e.yaml', nc=3, verbose=False)}, f)
+    return str(f)
+
+
+def test_load_resident(weights):
+    cpu = torch.device('cpu')
+    model = experimental.load_resident(weights, cpu)
+    assert experimental.load_resident(weights, cpu) is model  # loaded once
+    assert model.input_fold is None and model.class_ids is None
+
+    folded = experimental.load_resident(weights, cpu, fold=True)
+    assert folded is not model and folded.input_fold == 'bgr'
+    assert model.input_fold is None  # other entries are left alone
+
+    pruned = experimental.load_resident(weights, cpu, classes=1)
+    assert experimental.load_resident(weights, cpu, classes=[1]) is pruned  # int and list keys match
+    assert pruned.class_ids == [1] and len(experimental._resident) == 3
@@ -0,0 +1,53 @@
+# FrameRing shared-memory frame exchange
+
+import multiprocessing
+import pickle
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from utils.ring import FrameRing  # noqa: E402
+
+
+def produce(ring, n):
+    for i in range(1, n + 1):
+        ring.put(np.full(ring.shape, i, ring.dtype), stamp=float(i))
+    ring.close()
+
+
+def test_put_read():
+    with FrameRing((4, 6, 3), slots=3) as ring:
+        assert ring.read(timeout=0.01) is None  # empty
+        seq = ring.put(np.full((4, 6, 3), 7, np.uint8), stamp=1.5)
+        frame, stamp, s = ring.read()
+        assert (s, stamp, frame.shape) == (seq, 1.5, (4, 6, 3)) and (frame == 7).all()
+        assert ring.read(after=seq, timeout=0.01) is None  # nothing newer
+
+        for i in range(2, 6):
+            ring.put(np.full((4, 6, 3), i, np.uint8))
+        frame, _, s = ring.read(after=seq)
+        assert s == 5 and (frame == 5).all()  # newest only
+        assert not ring.valid(seq) and ring.valid(s)  # frame 1 was overwritten, its slot reused by frame 4
+
+
+def test_attach():
+    with FrameRing((2, 2), slots=2, dtype=np.float32) as ring:
+        other = pickle.loads(pickle.dumps(ring))  # attaches by name, as a child process does
+        assert (other.name, other.shape, other.dtype, other.owner) == (ring.name, (2, 2), np.float32, None)
+        seq = ring.put(np.eye(2, dtype=np.float32))
+        frame, _, s = other.read()
+        assert s == seq and np.array_equal(frame, np.eye(2))
+        other.close()  # detaches only
+        assert ring.valid(seq)
+
+
+@pytest.mark.parametrize('method', [m for m in ('fork', 'spawn') if m in multiprocessing.get_all_start_methods()])
+def test_process(method):
+    with FrameRing((8, 8), slots=4) as ring:
+        p = multiprocessing.get_context(method).Process(target=produce, args=(ring, 20))
+        p.start()
+        p.join(10)
+        assert p.exitcode == 0
+        frame, stamp, seq = ring.read(timeout=1.0)
+        assert (seq, stamp) == (20, 20.0) and (frame == 20).all()
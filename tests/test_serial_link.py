@@ -0,0 +1,125 @@
+# SerialLink acknowledgement matching, coalescing and telemetry against a fake motor controller
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('serial')
+
+from wheelchair import serial_link  # noqa: E402
+from wheelchair.serial_link import SerialLink  # noqa: E402
+
+
+def driver(line):
+    # motorDriver.ino replies to 'CMD,data\r'
+    return [f'Received: {line.strip()}']
+
+
+def wcm(line):
+    # wcm.ino replies to a single character move
+    return [SerialLink.moves.get(line, 'Invalid command')]
+
+
+class Firmware:
+    # Fake serial_asyncio.open_serial_connection() peer: records every write and queues reply(write) lines to read
+    def __init__(self, reply):
+        self.reply, self.writes, self.lines = reply, [], asyncio.Queue()
+
+    def emit(self, line):
+        self.lines.put_nowait(f'{line}\r\n'.encode())
+
+    # reader
+    async def readline(self):
+        return await self.lines.get()
+
+    # writer
+    def write(self, data):
+        self.writes.append(data)
+        for line in self.reply(data.decode()):
+            self.emit(line)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def run(monkeypatch, test, reply=driver, protocol='driver'):
+    # Runs async test(link, firmware) on a SerialLink connected to a Firmware, returns its result
+    firmware = []
+
+    async def open_serial_connection(url, baudrate):
+        firmware.append(Firmware(reply))
+        return firmware[0], firmware[0]
+
+    monkeypatch.setattr(serial_link, 'serial_asyncio', SimpleNamespace(open_serial_connection=open_serial_connection))
+
+    async def main():
+        async with SerialLink('fake', protocol=protocol) as link:
+            return await test(link, firmware[0])
+
+    return asyncio.run(main())
+
+
+def test_ack(monkeypatch):
+    async def test(link, firmware):
+        assert await link.command('pwm', 120) == 'Received: PWM,120'
+        assert await link.command('BRAKE') == 'Received: BRAKE,0'
+        assert firmware.writes == [b'PWM,120\r', b'BRAKE,0\r']
+
+    run(monkeypatch, test)
+
+
+def test_coalesce(monkeypatch):
+    async def test(link, firmware):
+        futures = [link.send('PWM', i) for i in range(3)] + [link.send('DIR', 1)]  # queued in one loop iteration
+        assert await asyncio.gather(*futures) == ['Received: PWM,2'] * 3 + ['Received: DIR,1']
+        assert firmware.writes == [b'PWM,2\r', b'DIR,1\r']  # newest PWM only
+
+    run(monkeypatch, test)
+
+
+def test_lost_ack(monkeypatch):
+    async def test(link, firmware):
+        firmware.reply = lambda line: driver(line) if line.startswith('DIR') else []  # PWM ack lost
+        pwm, direction = link.send('PWM', 50), link.send('DIR', 0)
+        assert await direction == 'Received: DIR,0'
+        with pytest.raises(ConnectionError):
+            await pwm
+
+    run(monkeypatch, test)
+
+
+def test_timeout_and_close(monkeypatch):
+    async def test(link, firmware):
+        firmware.reply = lambda line: []  # silent controller
+        with pytest.raises(asyncio.TimeoutError):
+            await link.command('PWM', 10, timeout=0.05)
+        return link.send('PWM', 20)
+
+    future = run(monkeypatch, test)
+    with pytest.raises(ConnectionError):  # commands still waiting fail once the link closes
+        future.result()
+
+
+def test_telemetry(monkeypatch):
+    async def test(link, firmware):
+        firmware.emit('Freq:12.5 RPM:30 MPH:1.5 KPH:2.4 ')
+        firmware.emit('motor ready')  # logged, ignored
+        firmware.emit('Freq:13.0 RPM:31 MPH:1.6 KPH:2.5 ')
+        await link.command('PWM', 1)  # replies come after the telemetry lines
+        return list(link.telemetry)
+
+    t = run(monkeypatch, test)
+    assert [(x.freq, x.rpm, x.mph, x.kph) for x in t] == [(12.5, 30, 1.5, 2.4), (13.0, 31, 1.6, 2.5)]
+
+
+def test_wcm(monkeypatch):
+    async def test(link, firmware):
+        assert await link.command('W') == 'Moving forward'
+        assert await link.command('x') == 'Invalid command'
+        assert firmware.writes == [b'w', b'x']
+
+    run(monkeypatch, test, wcm, 'wcm')
@@ -0,0 +1,85 @@
+# MediaSink queue policies and writes
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('cv2')
+
+from utils.sink import MediaSink  # noqa: E402
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    # Holds the writer thread in _write() until gate.set(), records the writes instead of doing them
+    gate, written = threading.Event(), []
+
+    def write(self, kind, path, x):
+        gate.wait()
+        written.append((kind, path, x))
+
+    monkeypatch.setattr(MediaSink, '_write', write)
+    gate.written = written
+    return gate
+
+
+def busy(policy, maxsize=2):
+    # Returns a sink whose writer is stuck on a first write, so later writes queue up
+    sink = MediaSink(maxsize, policy)
+    sink.labels('first.txt', 'x\n')
+    while sink.jobs:
+        time.sleep(0.001)
+    return sink
+
+
+def test_drop(gate):
+    sink = busy('drop')
+    for i in range(5):
+        sink.labels(f'{i}.txt', f'{i}\n')
+    gate.set()
+    sink.close()
+    assert sink.dropped == 3
+    assert gate.written == [('labels', 'first.txt', 'x\n'), ('labels', '3.txt', '3\n'), ('labels', '4.txt', '4\n')]
+
+
+def test_coalesce(gate):
+    sink = busy('coalesce')
+    for i in range(3):
+        sink.labels('a.txt', f'{i}\n')
+        sink.image('b.jpg', i)
+    sink.video('c.mp4', 0, 30, 2, 2)  # video frames are never merged, the oldest pending write is dropped
+    gate.set()
+    sink.close()
+    assert sink.dropped == 1
+    assert gate.written[1:] == [('image', 'b.jpg', 2), ('video', 'c.mp4', (0, 30, 2, 2))]
+
+
+def test_block(gate):
+    sink = busy('block')
+    t = threading.Thread(target=lambda: [sink.labels(f'{i}.txt', '') for i in range(10)])
+    t.start()
+    t.join(0.1)
+    assert t.is_alive() and len(sink.jobs) == 2  # waiting for room
+    gate.set()
+    t.join()
+    sink.close()
+    assert sink.dropped == 0
+    assert [p for _, p, _ in gate.written] == ['first.txt'] + [f'{i}.txt' for i in range(10)]
+
+
+def test_labels(tmp_path):
+    f = tmp_path / 'labels.txt'
+    with MediaSink(policy='coalesce') as sink:
+        for i in range(20):
+            sink.labels(f, f'0 {i}\n')
+    assert f.read_text() == ''.join(f'0 {i}\n' for i in range(20))
+    with pytest.raises(RuntimeError):
+        sink.labels(f, '')
+
+
+def test_error(tmp_path):
+    sink = MediaSink()
+    sink.labels(tmp_path / 'missing' / 'labels.txt', 'x\n')
+    with pytest.raises(OSError):
+        sink.close()
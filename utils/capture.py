@@ -0,0 +1,111 @@
+# Shared camera capture: one decoding thread per device, frames fanned out to any number of subscribers
+
+import logging
+import threading
+import time
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+_services = {}  # source -> running CaptureService
+_lock = threading.Lock()  # guards _services and subscriber counts
+
+
+class CaptureService:
+    # Owns one cv2.VideoCapture and decodes it in a daemon thread, keeping only the newest frame with its
+    # time.monotonic() capture stamp and sequence number. Every subscriber gets the same frame array (no copy per
+    # subscriber), so treat frames as read-only. Open through subscribe(), which shares one service per source and
+    # closes it with its last subscriber. Every frame is grabbed but only every min(strides)th one is decoded, so a
+    # detector alone on a camera (LoadStreams, stride 4) does not pay for the frames it would skip anyway
+    def __init__(self, source, every=1):
+        self.source = source
+        self.cap = cv2.VideoCapture(source)
+        assert self.cap.isOpened(), f'Failed to open {source}'
+        self.w = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.h = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) % 100
+        success, self.frame = self.cap.read()  # guarantee first frame
+        assert success, f'Failed to read {source}'
+        self.stamp, self.seq = time.monotonic(), 1
+        self.users = 1  # number of open subscriptions, starting with the one that opened it
+        self.strides = [every]  # frame stride requested by each open subscription
+        self.running = True
+        self.cv = threading.Condition()  # notified on every new frame and on stop
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        n = 0
+        while self.running:
+            success = self.cap.grab()
+            t = time.monotonic()
+            n += 1
+            if success and n < min(self.strides or [1]):
+                continue  # no subscriber wants this frame, skip decoding it
+            n = 0
+            if success:
+                success, im = self.cap.retrieve()
+            if not success:  # end of stream or device lost
+                logger.warning(f'capture of {self.source} stopped')
+                break
+            with self.cv:
+                self.frame, self.stamp = im, t
+                self.seq += 1
+                self.cv.notify_all()
+        with self.cv:
+            self.running = False
+            self.cv.notify_all()
+        self.cap.release()
+
+
+class Subscription:
+    # One consumer's view of a CaptureService, remembers the last frame it returned so a frame is never seen twice
+    def __init__(self, service, every=1):
+        self.service, self.every = service, every
+        self.seq = 0  # sequence number of the last frame returned
+
+    @property
+    def alive(self):
+        return self.service is not None and self.service.running
+
+    def read(self, timeout=None):
+        # Waits for a frame newer than the last one returned and returns (frame, stamp), None on timeout or once the
+        # service has stopped and the final frame was returned
+        s = self.service
+        if s is None:
+            return None
+        with s.cv:
+            s.cv.wait_for(lambda: s.seq > self.seq or not s.running, timeout)
+            if s.seq == self.seq:
+                return None
+            self.seq = s.seq
+            return s.frame, s.stamp
+
+    def poll(self):
+        # Non-blocking read(), for event loops
+        return self.read(timeout=0)
+
+    def close(self):
+        if self.service is not None:
+            with _lock:
+                s, self.service = self.service, None
+                s.users -= 1
+                s.strides.remove(self.every)
+                if s.users == 0:  # last subscriber, stop decoding and release the device
+                    s.running = False
+                    if _services.get(s.source) is s:
+                        del _services[s.source]
+
+
+def subscribe(source=0, every=1):
+    # Returns a Subscription to the shared CaptureService of source (device index, file or url), opening it on first
+    # use. every: frame stride this subscriber needs, the service decodes at the finest stride of its subscribers
+    with _lock:
+        s = _services.get(source)
+        if s is None or not s.running:
+            s = _services[source] = CaptureService(source, every)
+        else:
+            s.users += 1
+            s.strides.append(every)
+        return Subscription(s, every)
@@ -7,10 +7,12 @@ import os
 import random
 import shutil
 import time
+from collections import deque
+from functools import lru_cache
 from itertools import repeat
 from multiprocessing.pool import ThreadPool
 from pathlib import Path
-from threading import Thread
+from threading import Condition, Thread
 
 import cv2
 import numpy as np
@@ -22,6 +24,7 @@ from tqdm import tqdm
 
 from utils.general import check_requirements, xyxy2xywh, xywh2xyxy, xywhn2xyxy, xyn2xy, segment2box, segments2boxes, \
     resample_segments, clean_str
+from utils.capture import subscribe
 from utils.torch_utils import torch_distributed_zero_first
 
 # Parameters
@@ -120,7 +123,7 @@ class _RepeatSampler(object):
 
 
 class LoadImages:  # for inference
-    def __init__(self, path, img_size=640, stride=32):
+    def __init__(self, path, img_size=640, stride=32, raw=False, auto=True):
         p = str(Path(path).absolute())  # os-agnostic absolute path
         if '*' in p:
             files = sorted(glob.glob(p, recursive=True))  # glob
@@ -137,6 +140,8 @@ class LoadImages:  # for inference
 
         self.img_size = img_size
         self.stride = stride
+        self.raw = raw  # yield img=None and leave letterboxing to the caller (i.e. LetterboxBuffer)
+        self.auto = auto  # minimum rectangle letterbox, False for models exported at a fixed input shape
         self.files = images + videos
         self.nf = ni + nv  # number of files
         self.video_flag = [False] * ni + [True] * nv
@@ -181,8 +186,11 @@ class LoadImages:  # for inference
             assert img0 is not None, 'Image Not Found ' + path
             print(f'image {self.count}/{self.nf} {path}: ', end='')
 
+        if self.raw:
+            return path, None, img0, self.cap
+
         # Padded resize
-        img = letterbox(img0, self.img_size, stride=self.stride)[0]
+        img = letterbox_plan(img0.shape[:2], self.img_size, self.stride, self.auto).apply(img0)
 
         # Convert
         img = img[:, :, ::-1].transpose(2, 0, 1)  # BGR to RGB, to 3x416x416
@@ -245,7 +253,7 @@ class LoadWebcam:  # for inference
         print(f'webcam {self.count}: ', end='')
 
         # Padded resize
-        img = letterbox(img0, self.img_size, stride=self.stride)[0]
+        img = letterbox_plan(img0.shape[:2], self.img_size, self.stride).apply(img0)
 
         # Convert
         img = img[:, :, ::-1].transpose(2, 0, 1)  # BGR to RGB, to 3x416x416
@@ -258,10 +266,11 @@ class LoadWebcam:  # for inference
 
 
 class LoadStreams:  # multiple IP or RTSP cameras
-    def __init__(self, sources='streams.txt', img_size=640, stride=32):
+    def __init__(self, sources='streams.txt', img_size=640, stride=32, raw=False, auto=True):
         self.mode = 'stream'
         self.img_size = img_size
         self.stride = stride
+        self.raw = raw  # yield img=None and leave letterboxing to the caller (i.e. LetterboxBuffer)
 
         if os.path.isfile(sources):
             with open(sources, 'r') as f:
@@ -271,6 +280,11 @@ class LoadStreams:  # multiple IP or RTSP cameras
 
         n = len(sources)
         self.imgs = [None] * n
+        self.stamps = [0.0] * n  # time.monotonic() capture time of each slot
+        self.seqs = [0] * n  # capture sequence number of each slot
+        self.served = [0] * n  # sequence number last handed out by latest()
+        self.threads = []
+        self.cv = Condition()  # guards the slots, notified on every new frame
         self.sources = [clean_str(x) for x in sources]  # clean source names for later
         for i, s in enumerate(sources):
             # Start the thread to read frames from the video stream
@@ -280,50 +294,74 @@ class LoadStreams:  # multiple IP or RTSP cameras
             #     check_requirements(('pafy', 'youtube_dl'))
             #     import pafy
             #     url = pafy.new(url).getbest(preftype="mp4").url
-            cap = cv2.VideoCapture(url)
-            assert cap.isOpened(), f'Failed to open {s}'
-            w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            self.fps = cap.get(cv2.CAP_PROP_FPS) % 100
-
-            _, self.imgs[i] = cap.read()  # guarantee first frame
-            thread = Thread(target=self.update, args=([i, cap]), daemon=True)
+            sub = subscribe(url, every=4)  # read every 4th frame, shared with other readers, see utils/capture.py
+            w, h, self.fps = sub.service.w, sub.service.h, sub.service.fps
+
+            self.imgs[i], self.stamps[i] = sub.read()  # guarantee first frame
+            self.seqs[i] = 1
+            thread = Thread(target=self.update, args=([i, sub]), daemon=True)
             print(f' success ({w}x{h} at {self.fps:.2f} FPS).')
             thread.start()
+            self.threads.append(thread)
         print('')  # newline
 
         # check for common shapes
-        s = np.stack([letterbox(x, self.img_size, stride=self.stride)[0].shape for x in self.imgs], 0)  # shapes
-        self.rect = np.unique(s, axis=0).shape[0] == 1  # rect inference if all shapes equal
-        if not self.rect:
+        s = {letterbox_plan(x.shape[:2], self.img_size, self.stride).padded for x in self.imgs}  # shapes
+        self.rect = auto and len(s) == 1  # rect inference if all shapes equal
+        if len(s) > 1:
             print('WARNING: Different stream shapes detected. For optimal performance supply similarly-shaped streams.')
 
-    def update(self, index, cap):
-        # Read next stream frame in a daemon thread
-        n = 0
-        while cap.isOpened():
-            n += 1
-            # _, self.imgs[index] = cap.read()
-            cap.grab()
-            if n == 4:  # read every 4th frame
-                success, im = cap.retrieve()
-                self.imgs[index] = im if success else self.imgs[index] * 0
-                n = 0
-            # time.sleep(1 / self.fps)  # wait time
-    
+    def update(self, index, sub):
+        # Move each new frame of the stream's capture service into its slot in a daemon thread
+        while sub.alive:
+            frame = sub.read(timeout=1.0)
+            if frame is not None:
+                with self.cv:
+                    self.imgs[index], self.stamps[index] = frame
+                    self.seqs[index] += 1
+                    self.cv.notify_all()
+        sub.close()
+        with self.cv:  # stream lost, show it black, latest() stops waiting for it once this thread exits
+            self.imgs[index], self.stamps[index] = self.imgs[index] * 0, time.monotonic()
+            self.seqs[index] += 1
+            self.cv.notify_all()
+
+    def latest(self, timeout=1.0):
+        # Returns (imgs, stamps, ages) once every live stream has a frame newer than the last one returned, so a frame is
+        # never handed out twice (lost streams stay black). stamps are time.monotonic() capture times, ages seconds since
+        # capture. None on timeout
+        def ready():
+            return all(s > r or not t.is_alive() for s, r, t in zip(self.seqs, self.served, self.threads))
+
+        with self.cv:
+            if not self.cv.wait_for(ready, timeout):
+                return None
+            self.served = self.seqs.copy()
+            imgs, stamps = self.imgs.copy(), self.stamps.copy()
+        t = time.monotonic()
+        return imgs, stamps, [t - x for x in stamps]
+
     def __iter__(self):
         self.count = -1
         return self
 
     def __next__(self):
         self.count += 1
-        img0 = self.imgs.copy()
+        frames = None
+        while frames is None:
+            if not any(t.is_alive() for t in self.threads):  # every stream closed
+                raise StopIteration
+            frames = self.latest()
+        img0, self.frame_stamps, self.frame_ages = frames
         if cv2.waitKey(1) == ord('q'):  # q to quit
             cv2.destroyAllWindows()
             raise StopIteration
 
+        if self.raw:
+            return self.sources, None, img0, None
+
         # Letterbox
-        img = [letterbox(x, self.img_size, auto=self.rect, stride=self.stride)[0] for x in img0]
+        img = [letterbox_plan(x.shape[:2], self.img_size, self.stride, self.rect).apply(x) for x in img0]
 
         # Stack
         img = np.stack(img, 0)
@@ -849,6 +887,113 @@ def letterbox(img, new_shape=(640, 640), color=(114, 114, 114), auto=True, scale
     return img, ratio, (dw, dh)
 
 
+class LetterboxPlan:
+    # letterbox() geometry for one (source shape, img_size, stride, auto), computed once and shared by preprocessing
+    # (apply) and the inverse box transform (scale_coords(..., ratio_pad=plan.ratio_pad)). Build with letterbox_plan()
+    def __init__(self, shape, img_size=640, stride=32, auto=True):
+        new_shape = (img_size, img_size) if isinstance(img_size, int) else img_size
+        r = min(new_shape[0] / shape[0], new_shape[1] / shape[1])  # scale ratio (new / old)
+        self.new_unpad = int(round(shape[1] * r)), int(round(shape[0] * r))  # resized (w, h)
+        dw, dh = new_shape[1] - self.new_unpad[0], new_shape[0] - self.new_unpad[1]  # wh padding
+        if auto:  # minimum rectangle
+            dw, dh = dw % stride, dh % stride
+        self.top, self.bottom = int(round(dh / 2 - 0.1)), int(round(dh / 2 + 0.1))
+        self.left, self.right = int(round(dw / 2 - 0.1)), int(round(dw / 2 + 0.1))
+        self.shape = tuple(shape)  # source (h, w)
+        self.padded = self.new_unpad[1] + dh, self.new_unpad[0] + dw  # letterboxed (h, w)
+        self.ratio_pad = (r, r), (dw / 2, dh / 2)  # for scale_coords()
+
+    def apply(self, img, dst=None, color=(114, 114, 114), border=True):
+        # Letterboxes img into dst (padded shape, allocated if None) without copyMakeBorder. border=False skips painting
+        # the border, for a dst that already holds it from a previous frame with the same plan
+        (w, h), top, left = self.new_unpad, self.top, self.left
+        if dst is None:
+            dst, border = np.empty((*self.padded, 3), dtype=np.uint8), True
+        if border:
+            dst[:top], dst[top + h:] = color, color
+            dst[top:top + h, :left], dst[top:top + h, left + w:] = color, color
+        roi = dst[top:top + h, left:left + w]
+        if img.shape[:2] == (h, w):
+            roi[:] = img
+        else:
+            r = cv2.resize(img, (w, h), dst=roi, interpolation=cv2.INTER_LINEAR)
+            if not np.may_share_memory(r, roi):  # binding could not resize into the view
+                roi[:] = r
+        return dst
+
+
+@lru_cache(maxsize=64)
+def letterbox_plan(shape, img_size=640, stride=32, auto=True):
+    # Cached LetterboxPlan, shape is the source (h, w) and img_size an int or (h, w) tuple
+    return LetterboxPlan(shape, img_size, stride, auto)
+
+
+class LetterboxBuffer:
+    # Reusable inference preprocessing. Frames are letterboxed straight into a preallocated uint8 (bs,h,w,3) host
+    # buffer (pinned on CUDA), uploaded, and converted BGR HWC uint8 -> RGB CHW fp16/32 / 255 in place into a persistent
+    # device tensor, so constant-resolution sources allocate nothing per frame. With slots > 1 buffers rotate. Without
+    # lease a slot is simply reused slots batches later, with lease=True (pipelined capture) a returned tensor stays
+    # valid until release(img) and __call__ waits for a released slot. fold is the model's input_fold
+    # (Model.fold_input()): 'bgr' skips the channel swap and /255, 'rgb' skips /255
+    def __init__(self, img_size=640, stride=32, device='cpu', half=False, auto=True, color=(114, 114, 114), slots=1,
+                 fold=None, lease=False):
+        self.img_size, self.stride, self.auto, self.color, self.fold = img_size, stride, auto, color, fold
+        self.device = torch.device(device)
+        self.dtype = torch.float16 if half else torch.float32
+        self.slots = [None] * slots  # [host tensor, host array, device uint8 tensor, output tensor, plan per image]
+        self.i = 0  # next slot
+        self.lease = lease
+        self.free = deque(range(slots))  # lease mode: slots not held by a consumer
+        self.cv = Condition()
+
+    def _alloc(self, bs, h, w):
+        pin = self.device.type == 'cuda'
+        host = torch.empty((bs, h, w, 3), dtype=torch.uint8, pin_memory=pin)
+        dev = torch.empty_like(host, device=self.device) if pin else host
+        out = torch.empty((bs, 3, h, w), dtype=self.dtype, device=self.device)
+        return [host, host.numpy(), dev, out, [None] * bs]
+
+    def _acquire(self):
+        if not self.lease:
+            i, self.i = self.i, (self.i + 1) % len(self.slots)
+            return i
+        with self.cv:
+            self.cv.wait_for(lambda: self.free)
+            return self.free.popleft()
+
+    def release(self, img):
+        # lease mode: hands the slot of img (a tensor returned by __call__) back for reuse
+        with self.cv:
+            for i, slot in enumerate(self.slots):
+                if slot is not None and slot[3] is img and i not in self.free:
+                    self.free.append(i)
+                    self.cv.notify_all()
+                    return
+
+    def __call__(self, ims):
+        # ims: list of BGR HWC uint8 frames. Returns the (bs,3,h,w) normalized input tensor and each frame's LetterboxPlan
+        plans = [letterbox_plan(im.shape[:2], self.img_size, self.stride, self.auto) for im in ims]
+        h, w = plans[0].padded
+        assert all(p.padded == (h, w) for p in plans), 'letterboxed shapes differ within the batch, use auto=False'
+        i = self._acquire()
+        slot = self.slots[i]
+        if slot is None or slot[0].shape != (len(ims), h, w, 3):
+            slot = self.slots[i] = self._alloc(len(ims), h, w)
+
+        host, buf, dev, out, last = slot
+        for j, (im, plan) in enumerate(zip(ims, plans)):
+            plan.apply(im, buf[j], self.color, border=last[j] is not plan)  # border only repainted on a new geometry
+            last[j] = plan
+        if dev is not host:
+            dev.copy_(host, non_blocking=True)  # the host slot is rewritten only after the model consumed this batch
+        if self.fold == 'bgr':  # HWC to CHW, uint8 to fp16/32
+            out.copy_(dev.permute(0, 3, 1, 2))
+            return out, plans
+        for c in range(3):  # BGR to RGB, HWC to CHW, uint8 to fp16/32
+            out[:, c].copy_(dev[..., 2 - c])
+        return (out if self.fold else out.div_(255.0)), plans  # 0 - 255 to 0.0 - 1.0
+
+
 def random_perspective(img, targets=(), segments=(), degrees=10, translate=.1, scale=.1, shear=10, perspective=0.0,
                        border=(0, 0)):
     # torchvision.transforms.RandomAffine(degrees=(-10, 10), translate=(.1, .1), scale=(.9, 1.1), shear=(-10, 10))
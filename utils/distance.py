@@ -0,0 +1,132 @@
+# Monocular distance estimation utils
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def file_hash(path, chunk=1 << 20):
+    # Returns the sha1 hex digest of a file's contents, '' if the file does not exist
+    if not os.path.isfile(path):
+        return ''
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for b in iter(lambda: f.read(chunk), b''):
+            h.update(b)
+    return h.hexdigest()
+
+
+class CalibrationStore:
+    # Persisted focal-length calibrations, one entry per reference image. An entry is reused only while its key
+    # (reference image hash, weights hash, img_size, known width and distance) still matches
+    def __init__(self, path='ref/calibration.json'):
+        self.path = Path(path)
+        self.hashes = {}  # file -> (size, mtime, sha1), so each file is hashed at most once per process
+        try:
+            with open(self.path) as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+
+    def hash(self, f):
+        st = os.stat(f) if os.path.isfile(f) else None
+        stamp = (st.st_size, st.st_mtime) if st else (None, None)
+        if self.hashes.get(f, ())[:2] != stamp:
+            self.hashes[f] = (*stamp, file_hash(f))
+        return self.hashes[f][2]
+
+    def key(self, source, weights, img_size, width, distance):
+        return f'{self.hash(source)}:{self.hash(weights)}:{img_size}:{width:g}:{distance:g}'
+
+    def get(self, source, key):
+        # Returns (width_px, focal_length) for source if calibrated under key, else None
+        v = self.data.get(str(source))
+        return (v['width_px'], v['focal']) if v and v['key'] == key else None
+
+    def put(self, source, key, width_px, focal):
+        self.data[str(source)] = {'key': key, 'width_px': float(width_px), 'focal': float(focal)}
+        self.save()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp, self.path)  # atomic, a crash mid-write never leaves a corrupt store
+
+
+class DistanceEstimator:
+    # Per-class lookup tables that turn a (n,6) detection tensor [xyxy, conf, cls] into distances, zones and proximity
+    # flags with a handful of tensor ops, so the cost does not grow with the number of boxes in the frame
+    dtype = np.dtype([('xyxy', np.float32, 4), ('conf', np.float32), ('cls', np.int32), ('distance', np.float32),
+                      ('zone', np.int8), ('near', bool), ('far', bool)])
+    zones = 'left', 'center', 'right'
+
+    def __init__(self, names, focals, known_distance=25.0, margin=50, near=2.0, far=4.0):
+        # names: model class names, focals: {class name: focal length}, classes without a focal length are never near
+        f = torch.tensor([float(focals.get(n, 0)) for n in names])
+        self.scale = torch.where(f > 0, f * known_distance / 100, torch.full_like(f, float('inf')))  # d = scale / w
+        self.margin = margin  # (pixels) half width of the center zone
+        self.near, self.far = near, far  # (meters) alert and ignore distances
+
+    def __call__(self, det, width):
+        # det: (n,6) boxes in im0 pixels, width: im0 width. Returns a structured array of len n in det order
+        if self.scale.device != det.device:
+            self.scale = self.scale.to(det.device)
+        d = self.scale[det[:, 5].long()] / (det[:, 2] - det[:, 0])  # distance (m)
+        cx, c = (det[:, 0] + det[:, 2]) / 2, width / 2  # box and image center x
+        zone = (cx >= c - self.margin).float() + (cx > c + self.margin).float()  # 0 left, 1 center, 2 right
+        x = torch.cat((det[:, :6].float(), d[:, None].float(), zone[:, None]), 1).cpu().numpy()  # single transfer
+
+        out = np.empty(len(x), self.dtype)
+        out['xyxy'], out['conf'], out['cls'], out['distance'], out['zone'] = x[:, :4], x[:, 4], x[:, 5], x[:, 6], x[:, 7]
+        out['near'] = out['distance'] < self.near
+        out['far'] = out['distance'] >= self.far
+        return out
+
+
+class FrameResult:
+    # One frame of Detect.stream() output. det is a DistanceEstimator structured array (most confident box first),
+    # im0 the original BGR frame, still shared with the loader so copy it before drawing on it
+    def __init__(self, id, t, path, index, frame, mode, im0, shape, det, dt, vid_cap=None):
+        self.id = id  # running frame number of the stream
+        self.t = t  # capture timestamp (time.monotonic())
+        self.path = path  # source path or stream name
+        self.index = index  # image index within the batch (stream number for multi-stream sources)
+        self.frame = frame  # loader frame counter, used to name per-frame label files
+        self.mode = mode  # 'image', 'video' or 'stream'
+        self.im0 = im0
+        self.shape = shape  # inference image shape (h, w)
+        self.det = det
+        self.dt = dt  # inference + NMS seconds
+        self.vid_cap = vid_cap
+
+    @property
+    def boxes(self):
+        return self.det['xyxy']  # xyxy pixels
+
+    @property
+    def classes(self):
+        return self.det['cls']
+
+    @property
+    def confidences(self):
+        return self.det['conf']
+
+    @property
+    def distances(self):
+        return self.det['distance']  # meters
+
+    @property
+    def zones(self):
+        return self.det['zone']  # 0 left, 1 center, 2 right
+
+    def __len__(self):
+        return len(self.det)
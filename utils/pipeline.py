@@ -0,0 +1,121 @@
+# Pipelined capture / inference / render runtime
+
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class DropQueue:
+    # Small bounded queue between two pipeline stages. When full, put() discards the oldest item (drop=True, live
+    # sources where only fresh frames matter) or waits for room (drop=False, files that must not lose frames). on_drop
+    # is called with every item that is discarded or put after close()
+    def __init__(self, maxsize=2, drop=True, on_drop=None):
+        self.items = deque()
+        self.maxsize, self.drop, self.on_drop = maxsize, drop, on_drop
+        self.dropped = 0  # number of stale items discarded
+        self.closed = False
+        self.cv = threading.Condition()
+
+    def put(self, item):
+        with self.cv:
+            while not self.drop and len(self.items) >= self.maxsize and not self.closed:
+                self.cv.wait()
+            if self.closed:
+                if self.on_drop:
+                    self.on_drop(item)
+                return
+            if len(self.items) >= self.maxsize:
+                old = self.items.popleft()
+                self.dropped += 1
+                if self.on_drop:
+                    self.on_drop(old)
+            self.items.append(item)
+            self.cv.notify_all()
+
+    def close(self):
+        with self.cv:
+            self.closed = True
+            self.cv.notify_all()
+
+    def __iter__(self):
+        # Yields items until the queue is closed and drained
+        while True:
+            with self.cv:
+                while not self.items and not self.closed:
+                    self.cv.wait()
+                if not self.items:
+                    return
+                item = self.items.popleft()
+                self.cv.notify_all()
+            yield item
+
+
+class Pipeline:
+    # Iterates source (capture) and runs every stage in its own daemon thread, connected by DropQueues. Each stage maps
+    # an item to the next stage's input (None skips it), the last stage is the sink. An exception in any worker stops
+    # the whole pipeline and is re-raised by run(). release(item) is called for every source item that never reaches the
+    # first stage (dropped, or left over after a failure), e.g. to return its buffer slot
+    def __init__(self, source, *stages, maxsize=2, drop=True, release=None):
+        self.source, self.stages, self.release = source, stages, release
+        self.queues = [DropQueue(maxsize, drop, on_drop=release if i == 0 else None) for i in range(len(stages))]
+        self.error = None
+
+    def _fail(self, e):
+        self.error = self.error or e
+        for q in self.queues:
+            q.close()  # unblock and stop every other worker
+        if self.release:  # the first stage may be gone, release what it will never take
+            q = self.queues[0]
+            with q.cv:
+                items, q.items = list(q.items), deque()
+            for x in items:
+                self.release(x)
+
+    def _capture(self):
+        q = self.queues[0]
+        try:
+            for x in self.source:
+                q.put(x)  # released by the queue if it is closed meanwhile
+                if q.closed:
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            q.close()
+
+    def _stage(self, i):
+        q_in, q_out = self.queues[i], self.queues[i + 1] if i + 1 < len(self.queues) else None
+        try:
+            for x in q_in:
+                y = self.stages[i](x)
+                if q_out is not None:
+                    if q_out.closed:
+                        break
+                    if y is not None:
+                        q_out.put(y)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            if q_out is not None:
+                q_out.close()
+
+    def run(self):
+        threads = [threading.Thread(target=self._capture, daemon=True)] + \
+                  [threading.Thread(target=self._stage, args=(i,), daemon=True) for i in range(len(self.stages))]
+        for t in threads:
+            t.start()
+        try:
+            for t in threads:
+                while t.is_alive():
+                    t.join(0.1)  # short joins keep Ctrl-C responsive
+        except KeyboardInterrupt:
+            self._fail(KeyboardInterrupt())
+            raise
+        if self.error:
+            raise self.error
+        dropped = [q.dropped for q in self.queues]
+        if any(dropped):
+            logger.info(f'Pipeline dropped {dropped} stale items per stage queue')
+        return dropped
@@ -0,0 +1,152 @@
+# NumPy-only post-processing (decode, NMS, scale_coords) for torch-free ONNX runtimes
+# Mirrors models.backends.Backend.decode() and utils.general non_max_suppression() / scale_coords() without importing
+# torch or torchvision, so an onnxruntime or cv2.dnn detector process starts fast and stays small
+
+import time
+
+import numpy as np
+
+_grids = {}  # (stride, anchors, h, w) -> (xy gain, xy offset, wh gain), each (N, 2)
+
+
+def make_grid(stride, anchors, h, w):
+    # stride: (nl,) pixels, anchors: (nl, na, 2) pixels. Returns the decode tensors of a (h, w) input
+    key = (tuple(stride), anchors.tobytes(), h, w)
+    if key not in _grids:
+        gain, offset, wh = [], [], []
+        for s, a in zip(stride, anchors):
+            ny, nx = h // int(s), w // int(s)
+            yv, xv = np.meshgrid(np.arange(ny), np.arange(nx), indexing='ij')
+            xy = np.tile(np.stack((xv, yv), 2).reshape(-1, 2), (len(a), 1)).astype(np.float32)
+            gain.append(np.full_like(xy, 2 * s))
+            offset.append((xy - 0.5) * s)
+            wh.append(np.repeat(a * 4, ny * nx, 0))
+        _grids[key] = [np.concatenate(x).astype(np.float32) for x in (gain, offset, wh)]
+    return _grids[key]
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def decode(y, output, stride, anchors, h, w):
+    # y: list of model outputs for a (h, w) input in the export output format ('grid', 'cat' or 'raw', see
+    # models/backends.py). Returns the (bs,N,no) prediction non_max_suppression() expects
+    if output == 'grid':
+        return y[0]
+    stride, anchors = np.asarray(stride, np.float32), np.asarray(anchors, np.float32).reshape(len(stride), -1, 2)
+    if output == 'raw':  # largest (stride 8) level first, as in Detect.forward()
+        y = sorted(y, key=lambda x: -x.size)[:len(stride)]
+        y = sigmoid(np.concatenate([x.reshape(x.shape[0], -1, x.shape[-1]) for x in y], 1))
+    else:  # 'cat'
+        y = y[0]
+    gain, offset, wh = make_grid(stride, anchors, h, w)
+    return np.concatenate((y[..., :2] * gain + offset, y[..., 2:4] ** 2 * wh, y[..., 4:]), -1)
+
+
+def xywh2xyxy(x):
+    # Convert nx4 boxes from [x, y, w, h] to [x1, y1, x2, y2] where xy1=top-left, xy2=bottom-right
+    y = np.copy(x)
+    y[:, 0] = x[:, 0] - x[:, 2] / 2  # top left x
+    y[:, 1] = x[:, 1] - x[:, 3] / 2  # top left y
+    y[:, 2] = x[:, 0] + x[:, 2] / 2  # bottom right x
+    y[:, 3] = x[:, 1] + x[:, 3] / 2  # bottom right y
+    return y
+
+
+def nms(boxes, scores, iou_thres):
+    # Greedy NMS like torchvision.ops.nms(): returns the indices of the kept boxes, highest score first
+    x1, y1, x2, y2 = boxes.T
+    area = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while order.size:
+        i, order = order[0], order[1:]
+        keep.append(i)
+        w = (np.minimum(x2[i], x2[order]) - np.maximum(x1[i], x1[order])).clip(0)
+        h = (np.minimum(y2[i], y2[order]) - np.maximum(y1[i], y1[order])).clip(0)
+        inter = w * h
+        order = order[inter / (area[i] + area[order] - inter) <= iou_thres]
+    return np.array(keep, dtype=np.int64)
+
+
+def per_image_top(b, scores, k):
+    # Returns the indices of the k highest scores of each image index b, grouped by image, highest first. Stable, equal
+    # scores keep their input order
+    i = np.lexsort((np.arange(len(b)), -scores, b))  # by image, then score descending, then input order
+    n = np.bincount(b)
+    rank = np.arange(len(i)) - (n.cumsum() - n)[b[i]]  # position within the image
+    return i[rank < k]
+
+
+def non_max_suppression(prediction, conf_thres=0.25, iou_thres=0.45, classes=None, agnostic=False, multi_label=False,
+                        max_det=300):
+    """Runs Non-Maximum Suppression (NMS) on a (bs,N,no) numpy prediction, see utils.general.non_max_suppression()
+
+    Returns:
+         list of detections, on (n,6) float32 array per image [xyxy, conf, cls]
+    """
+
+    bs, nc = prediction.shape[0], prediction.shape[2] - 5  # batch size, number of classes
+    max_wh, max_nms = 4096, 30000  # (pixels) maximum box width and height, maximum number of boxes into nms()
+    time_limit = 10.0  # seconds to warn after
+    multi_label &= nc > 1  # multiple labels per box
+
+    t = time.time()
+    b, a = np.nonzero(prediction[..., 4] > conf_thres)  # image, anchor index of the candidates
+    x = prediction[b, a].astype(np.float32)
+    x[:, 5:] *= x[:, 4:5]  # conf = obj_conf * cls_conf
+    box = xywh2xyxy(x[:, :4])
+
+    # Detections matrix nx6 (xyxy, conf, cls)
+    if multi_label:
+        i, j = np.nonzero(x[:, 5:] > conf_thres)
+        x, b = np.concatenate((box[i], x[i, j + 5, None], j[:, None].astype(np.float32)), 1), b[i]
+    else:  # best class only
+        j = x[:, 5:].argmax(1)
+        conf = x[np.arange(len(x)), j + 5]
+        i = conf > conf_thres
+        x, b = np.concatenate((box, conf[:, None], j[:, None].astype(np.float32)), 1)[i], b[i]
+
+    # Filter by class
+    if classes is not None:
+        i = np.isin(x[:, 5], classes)
+        x, b = x[i], b[i]
+
+    # Group by image, most confident first, at most max_nms boxes per image
+    i = per_image_top(b, x[:, 4], max_nms)
+    x, n = x[i], np.bincount(b[i], minlength=bs)
+
+    # NMS per image, boxes offset by class (float64)
+    output = [np.zeros((0, 6), np.float32) for _ in range(bs)]
+    for xi, x in enumerate(np.split(x, n.cumsum()[:-1])):  # image index, image detections
+        if not len(x):  # no boxes
+            continue
+        c = x[:, 5:6].astype(np.float64) * (0 if agnostic else max_wh)  # classes
+        output[xi] = x[nms(x[:, :4].astype(np.float64) + c, x[:, 4], iou_thres)[:max_det]]  # limit detections
+        if (time.time() - t) > time_limit:
+            print(f'WARNING: NMS time limit {time_limit}s exceeded')
+            break  # time limit exceeded
+    return output
+
+
+def scale_coords(img1_shape, coords, img0_shape, ratio_pad=None):
+    # Rescale coords (xyxy) from img1_shape to img0_shape, in place
+    if ratio_pad is None:  # calculate from img0_shape
+        gain = min(img1_shape[0] / img0_shape[0], img1_shape[1] / img0_shape[1])  # gain  = old / new
+        pad = (img1_shape[1] - img0_shape[1] * gain) / 2, (img1_shape[0] - img0_shape[0] * gain) / 2  # wh padding
+    else:
+        gain = ratio_pad[0][0]
+        pad = ratio_pad[1]
+
+    coords[:, [0, 2]] -= pad[0]  # x padding
+    coords[:, [1, 3]] -= pad[1]  # y padding
+    coords[:, :4] /= gain
+    clip_coords(coords, img0_shape)
+    return coords
+
+
+def clip_coords(boxes, img_shape):
+    # Clip bounding xyxy bounding boxes to image shape (height, width), in place
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, img_shape[1])  # x1, x2
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, img_shape[0])  # y1, y2
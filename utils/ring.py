@@ -0,0 +1,101 @@
+# Shared-memory frame ring buffer for exchanging frames between processes without copies or pickling
+
+import logging
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FrameRing:
+    # Fixed-size frame slots in one multiprocessing.shared_memory block, written by a single producer and read by any
+    # number of consumers in other processes. Frame n (1, 2, ...) goes to slot n % slots and each slot records the
+    # sequence number and time.monotonic() stamp of the frame it holds, so a reader can tell a slot was overwritten
+    # while it used it: read() returns a view into shared memory, valid(seq) is True while that frame is still intact.
+    # A FrameRing pickles as its name and geometry, pass it to multiprocessing.Process args to attach in the child
+    meta = np.dtype([('seq', np.int64), ('stamp', np.float64)])
+
+    def __init__(self, shape, slots=4, dtype=np.uint8, name=None, create=True):
+        self.shape, self.slots, self.dtype = tuple(shape), slots, np.dtype(dtype)
+        header = 8 + self.meta.itemsize * slots  # latest seq, slot metadata
+        header += -header % 64  # cache line aligned frames
+        size = header + slots * int(np.prod(self.shape)) * self.dtype.itemsize
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            try:  # python>=3.13, only the creator owns (and unlinks) the block
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                self.shm = shared_memory.SharedMemory(name=name)
+        self.name, self.owner = self.shm.name, os.getpid() if create else None  # pid of the creating process
+        buf = self.shm.buf
+        self.head = np.ndarray((1,), np.int64, buf)  # seq of the newest complete frame, 0 for none
+        self.info = np.ndarray((slots,), self.meta, buf, 8)
+        self.frames = np.ndarray((slots, *self.shape), self.dtype, buf, header)
+        if create:
+            self.head[0], self.info['seq'], self.info['stamp'] = 0, 0, 0.0
+
+    def __reduce__(self):
+        return self.__class__, (self.shape, self.slots, self.dtype, self.name, False)
+
+    def put(self, frame, stamp=None):
+        # Copies frame (of the ring's shape) into the next slot and publishes it, returns its sequence number
+        seq = int(self.head[0]) + 1
+        i = seq % self.slots
+        self.info[i]['seq'] = -1  # being written, valid() fails for the old frame from here on
+        self.frames[i] = frame
+        self.info[i]['stamp'] = time.monotonic() if stamp is None else stamp
+        self.info[i]['seq'] = seq
+        self.head[0] = seq
+        return seq
+
+    def valid(self, seq):
+        return int(self.info[seq % self.slots]['seq']) == seq
+
+    def read(self, after=0, timeout=1.0, poll=0.001):
+        # Waits for a frame newer than seq after and returns (frame view, stamp, seq) of the newest one, None on
+        # timeout. The view is zero-copy, check valid(seq) after using it (or copy it) if the producer may lap the reader
+        t = time.monotonic() + timeout
+        while True:
+            seq = int(self.head[0])
+            if seq > after:
+                i = seq % self.slots
+                frame, stamp = self.frames[i], float(self.info[i]['stamp'])
+                if self.valid(seq):
+                    return frame, stamp, seq
+                continue  # overwritten meanwhile, take the newer one
+            if time.monotonic() > t:
+                return None
+            time.sleep(poll)
+
+    def close(self):
+        # Detaches this process, the creator also frees the shared memory (not a forked child that inherited the ring)
+        self.head = self.info = self.frames = None  # release the views before closing the buffer
+        self.shm.close()
+        if self.owner == os.getpid():
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def publish(source, ring, stop=None):
+    # Capture process target: copies every frame of the shared capture of source into ring until the capture ends or
+    # stop (a multiprocessing.Event) is set, e.g. Process(target=publish, args=(0, FrameRing((480, 640, 3)))).start()
+    from utils.capture import subscribe
+
+    sub = subscribe(source)
+    try:
+        while sub.alive and not (stop and stop.is_set()):
+            frame = sub.read(timeout=1.0)
+            if frame is not None:
+                ring.put(*frame)
+    finally:
+        sub.close()
+        ring.close()
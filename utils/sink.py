@@ -0,0 +1,106 @@
+# Background media sink: image, video and label file writes off the inference thread
+
+import logging
+import threading
+from collections import deque
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+class MediaSink:
+    # Owns every disk write of the detect loop in one writer thread behind a bounded queue. When the queue is full:
+    #   'block'     the caller waits for room, nothing is lost
+    #   'drop'      the oldest pending write is discarded
+    #   'coalesce'  like 'drop', and a pending image or label write to the same file is merged with the new one
+    #               (newest image wins, label lines are appended together) so slow storage sees fewer, larger writes
+    # Arrays handed to image() / video() are written later, do not modify them afterwards
+    policies = 'block', 'drop', 'coalesce'
+
+    def __init__(self, maxsize=8, policy='block'):
+        assert policy in self.policies, f'unknown sink policy {policy}, use one of {self.policies}'
+        self.maxsize, self.policy = maxsize, policy
+        self.jobs = deque()  # (kind, path, payload)
+        self.dropped = 0  # number of writes discarded
+        self.closed = False
+        self.error = None
+        self.cv = threading.Condition()
+        self.vid_path, self.vid_writer = None, None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def image(self, path, im):
+        self._put('image', str(path), im)
+
+    def video(self, path, im, fps, w, h):
+        # Appends im to the video at path, a new path releases the previous writer and opens a new one
+        self._put('video', str(path), (im, fps, w, h))
+
+    def labels(self, path, text):
+        self._put('labels', str(path), text)
+
+    def _put(self, kind, path, x):
+        with self.cv:
+            if self.closed:
+                raise RuntimeError('MediaSink is closed')
+            if self.policy == 'coalesce' and kind != 'video':
+                for i, (k, p, y) in enumerate(self.jobs):
+                    if k == kind and p == path:
+                        self.jobs[i] = (k, p, y + x if kind == 'labels' else x)
+                        return
+            while self.policy == 'block' and len(self.jobs) >= self.maxsize:
+                self.cv.wait()
+            if len(self.jobs) >= self.maxsize:
+                self.jobs.popleft()
+                self.dropped += 1
+            self.jobs.append((kind, path, x))
+            self.cv.notify_all()
+
+    def _write(self, kind, path, x):
+        if kind == 'image':
+            cv2.imwrite(path, x)
+        elif kind == 'labels':
+            with open(path, 'a') as f:
+                f.write(x)
+        else:  # video
+            im, fps, w, h = x
+            if self.vid_path != path:  # new video
+                self.vid_path = path
+                if isinstance(self.vid_writer, cv2.VideoWriter):
+                    self.vid_writer.release()  # release previous video writer
+                self.vid_writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+            self.vid_writer.write(im)
+
+    def _run(self):
+        while True:
+            with self.cv:
+                while not self.jobs and not self.closed:
+                    self.cv.wait()
+                if not self.jobs:
+                    break
+                job = self.jobs.popleft()
+                self.cv.notify_all()
+            try:
+                self._write(*job)
+            except Exception as e:  # keep draining, close() re-raises the first error
+                self.error = self.error or e
+        if isinstance(self.vid_writer, cv2.VideoWriter):
+            self.vid_writer.release()
+
+    def close(self):
+        # Flushes every pending write, releases the video writer and re-raises the first write error
+        with self.cv:
+            self.closed = True
+            self.cv.notify_all()
+        self.thread.join()
+        if self.dropped:
+            logger.info(f'MediaSink dropped {self.dropped} writes ({self.policy} policy)')
+        if self.error:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -201,6 +201,19 @@ def fuse_conv_and_bn(conv, bn):
     return fusedconv
 
 
+def fuse_convs_and_bn(convs, bn):
+    # Fuse convolutions whose concatenated outputs feed one batchnorm, bn(torch.cat([conv(x) for conv in convs], 1))
+    fused, i = [], 0
+    for conv in convs:
+        n = conv.out_channels
+        b = nn.BatchNorm2d(n, eps=bn.eps).to(bn.weight.device)  # this conv's channel slice of bn
+        b.weight.data, b.bias.data = bn.weight.data[i:i + n].clone(), bn.bias.data[i:i + n].clone()
+        b.running_mean, b.running_var = bn.running_mean[i:i + n].clone(), bn.running_var[i:i + n].clone()
+        fused.append(fuse_conv_and_bn(conv, b))
+        i += n
+    return fused
+
+
 def model_info(model, verbose=False, img_size=640):
     # Model information. img_size may be int or list, i.e. img_size=640 or img_size=[640, 320]
     n_p = sum(x.numel() for x in model.parameters())  # number parameters
@@ -244,7 +257,7 @@ def load_classifier(name='resnet101', n=2):
     return model
 
 
-def scale_img(img, ratio=1.0, same_shape=False, gs=32):  # img(16,3,256,416)
+def scale_img(img, ratio=1.0, same_shape=False, gs=32, value=0.447):  # img(16,3,256,416)
     # scales img(bs,3,y,x) by ratio constrained to gs-multiple
     if ratio == 1.0:
         return img
@@ -254,7 +267,7 @@ def scale_img(img, ratio=1.0, same_shape=False, gs=32):  # img(16,3,256,416)
         img = F.interpolate(img, size=s, mode='bilinear', align_corners=False)  # resize
         if not same_shape:  # pad/crop img
             h, w = [math.ceil(x * ratio / gs) * gs for x in (h, w)]
-        return F.pad(img, [0, w - s[1], 0, h - s[0]], value=0.447)  # value = imagenet mean
+        return F.pad(img, [0, w - s[1], 0, h - s[0]], value=value)  # value = imagenet mean
 
 
 def copy_attr(a, b, include=(), exclude=()):
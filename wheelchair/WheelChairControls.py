@@ -1,15 +1,20 @@
-import serial
-import time
+import asyncio
 
-arduino = serial.Serial(port='COM4', baudrate=115200, timeout=.1)
+from serial_link import SerialLink
 
-def write_read(x):
-    arduino.write(bytes(x, 'utf-8'))
-    time.sleep(0.05)
-    data = arduino.readline()
-    return data
 
-while True:
-    num = input("Input Controls: ")
-    value = write_read(num)
-    print(value)
\ No newline at end of file
+async def main():
+    # Interactive console: type 'CMD,data' (e.g. PWM,120), the acknowledgement and latest telemetry are printed
+    async with SerialLink(port='COM4', baudrate=115200) as link:
+        loop = asyncio.get_running_loop()
+        while True:
+            num = await loop.run_in_executor(None, input, "Input Controls: ")
+            command, _, data = num.partition(',')
+            try:
+                value = await link.command(command.strip(), data.strip() or None)
+            except (asyncio.TimeoutError, ConnectionError, ValueError) as e:
+                value = f'no acknowledgement ({e!r})'
+            print(value, link.latest)
+
+
+asyncio.run(main())
@@ -0,0 +1,197 @@
+# Non-blocking asyncio serial link to the wheelchair motor controller (motorDriver.ino or wcm.ino firmware)
+
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import deque, namedtuple
+
+import serial
+
+try:
+    import serial_asyncio  # pyserial-asyncio, optional
+except ImportError:
+    serial_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+Telemetry = namedtuple('Telemetry', 't freq rpm mph kph')  # t: time.monotonic() of the line
+
+
+class _ThreadedPort:
+    # pyserial fallback when pyserial-asyncio is not installed: blocking calls run in the default executor
+    def __init__(self, port, baudrate):
+        self.ser = serial.Serial(port=port, baudrate=baudrate, timeout=0.1)
+
+    async def readline(self):
+        loop = asyncio.get_running_loop()
+        line = b''
+        while not line.endswith(b'\n'):
+            line += await loop.run_in_executor(None, self.ser.readline)  # b'' after the 0.1s timeout
+        return line
+
+    async def write(self, data):
+        await asyncio.get_running_loop().run_in_executor(None, self.ser.write, data)
+
+    def close(self):
+        self.ser.close()
+
+
+class _AsyncPort:
+    def __init__(self, reader, writer):
+        self.reader, self.writer = reader, writer
+
+    async def readline(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError('serial port closed')
+        return line
+
+    async def write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def close(self):
+        self.writer.close()
+
+
+class SerialLink:
+    # One writer task drains a queue of commands and one reader task parses every incoming line, so nothing ever
+    # sleeps or blocks on the port. Commands of the same kind that are still queued are coalesced, only the newest is
+    # sent and every caller waiting on a superseded one gets its acknowledgement. Protocols:
+    #   'driver'  motorDriver.ino, 'CMD,data\r' (PWM, BRAKE, DIR) acknowledged by 'Received: CMD,data', telemetry
+    #             lines 'Freq:x RPM:x MPH:x KPH:x ' are kept in a ring buffer
+    #   'wcm'     wcm.ino, single character moves w/a/s/d acknowledged by 'Moving ...' (or 'Invalid command')
+    moves = {'w': 'Moving forward', 'a': 'Moving left', 's': 'Moving backward', 'd': 'Moving right'}
+    telemetry_re = re.compile(r'Freq:(\S+) RPM:(\S+) MPH:(\S+) KPH:(\S+)')
+
+    def __init__(self, port='COM4', baudrate=115200, protocol='driver', telemetry=256):
+        assert protocol in ('driver', 'wcm'), f'unknown protocol {protocol}'
+        self.port, self.baudrate, self.protocol = port, baudrate, protocol
+        self.telemetry = deque(maxlen=telemetry)  # newest last
+        self.pending = {}  # queued commands, kind -> (bytes, ack, futures), insertion ordered
+        self.acks = deque()  # sent commands awaiting acknowledgement, (ack, futures)
+        self.loop = None
+        self.io = None
+        self.wake = None  # set when pending gets a command
+        self.tasks = []
+
+    async def open(self):
+        self.loop = asyncio.get_running_loop()
+        if serial_asyncio:
+            self.io = _AsyncPort(*await serial_asyncio.open_serial_connection(url=self.port, baudrate=self.baudrate))
+        else:
+            self.io = _ThreadedPort(self.port, self.baudrate)
+        self.wake = asyncio.Event()
+        self.tasks = [asyncio.ensure_future(self._writer()), asyncio.ensure_future(self._reader())]
+        return self
+
+    async def close(self):
+        for t in self.tasks:
+            t.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.io.close()
+        for _, (_, _, futures) in self.pending.items():
+            self._resolve(futures, exc=ConnectionError('serial link closed'))
+        for _, futures in self.acks:
+            self._resolve(futures, exc=ConnectionError('serial link closed'))
+        self.pending.clear()
+        self.acks.clear()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def _encode(self, command, data):
+        # Returns (kind, bytes, expected acknowledgement) of a command
+        if self.protocol == 'wcm':
+            command = command.lower()
+            return 'move', command.encode(), self.moves.get(command, 'Invalid command')
+        command, data = command.upper(), int(data or 0)
+        return command, f'{command},{data}\r'.encode(), f'Received: {command},{data}'
+
+    def send(self, command, data=None):
+        # Queues a command (event loop thread) and returns a future resolved with its acknowledgement line
+        kind, b, ack = self._encode(command, data)
+        futures = self.pending.pop(kind, (None, None, []))[2]  # superseded commands share the new acknowledgement
+        future = self.loop.create_future()
+        self.pending[kind] = (b, ack, futures + [future])
+        self.wake.set()
+        return future
+
+    async def command(self, command, data=None, timeout=1.0):
+        # Sends a command and returns its acknowledgement line, raises asyncio.TimeoutError if none arrives in time
+        return await asyncio.wait_for(asyncio.shield(self.send(command, data)), timeout)
+
+    def post(self, command, data=None):
+        # Thread-safe, never blocks: queues a command from any thread (e.g. the detection loop), fire and forget
+        self.loop.call_soon_threadsafe(self.send, command, data)
+
+    @property
+    def latest(self):
+        return self.telemetry[-1] if self.telemetry else None
+
+    @staticmethod
+    def _resolve(futures, result=None, exc=None):
+        for f in futures:
+            if f.done():
+                continue
+            if exc:
+                f.set_exception(exc)
+            else:
+                f.set_result(result)
+
+    async def _writer(self):
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            while self.pending:
+                kind = next(iter(self.pending))
+                b, ack, futures = self.pending.pop(kind)
+                self.acks.append((ack, futures))
+                await self.io.write(b)
+
+    async def _reader(self):
+        while True:
+            line = (await self.io.readline()).decode(errors='replace').strip()
+            if not line:
+                continue
+            m = self.telemetry_re.match(line)
+            if m:
+                self.telemetry.append(Telemetry(time.monotonic(), *map(float, m.groups())))
+            elif self.acks and (line.startswith('Received:') or line in self.moves.values() or line == 'Invalid command'):
+                for i, (ack, futures) in enumerate(self.acks):
+                    if ack == line:  # acknowledges this command, earlier ones got lost
+                        for _ in range(i):
+                            self._resolve(self.acks.popleft()[1], exc=ConnectionError(f'no acknowledgement, got {line}'))
+                        self._resolve(self.acks.popleft()[1], line)
+                        break
+            else:
+                logger.debug(f'{self.port}: {line}')
+
+
+def start_link(port='COM4', baudrate=115200, protocol='driver'):
+    # Opens a SerialLink on an event loop in a daemon thread and returns it, for synchronous callers that use post()
+    link, ready = SerialLink(port, baudrate, protocol), threading.Event()
+    errors = []
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(link.open())
+        except Exception as e:
+            errors.append(e)
+            return
+        finally:
+            ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    if errors:
+        raise errors[0]
+    return link
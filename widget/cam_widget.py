@@ -1,23 +1,31 @@
 import tkinter as tk
+
 import cv2 as cv
 from PIL import ImageTk, Image
 
+from utils.capture import subscribe
+
+
 class CamWidget(tk.Frame):
-    def __init__(self, parent, width=480, height=360, *args, **kwargs):
+    def __init__(self, parent, width=480, height=360, source=0, fps=30, *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
         self.width = width
         self.height = height
-        self.cv_frame = tk.Label(self, width=self.width, height=self.height)
+        self.interval = max(1, round(1000 / fps))  # (ms) preview refresh
+        self.photo = ImageTk.PhotoImage('RGB', (self.width, self.height))  # reused for every frame
+        self.cv_frame = tk.Label(self, width=self.width, height=self.height, image=self.photo)
         self.cv_frame.pack()
-        self.cap = cv.VideoCapture(0)
+        self.sub = subscribe(source)  # shared camera, decoded in a background thread
         self.update_video_feed()
 
     def update_video_feed(self):
-        _, frame = self.cap.read()  # Read a frame from the camera
-        frame = cv.cvtColor(frame, cv.COLOR_BGR2RGB)  # Convert frame colors from BGR to RGB
-        image = Image.fromarray(frame)  # Create an Image object from the frame
-        image = image.resize((self.width, self.height), Image.ANTIALIAS)  # Resize the image
-        photo = ImageTk.PhotoImage(image)  # Convert the Image object to PhotoImage
-        self.cv_frame.configure(image=photo)  # Set the image in the Label
-        self.cv_frame.image = photo  # Store a reference to the image to prevent garbage collection
-        self.cv_frame.after(10, self.update_video_feed)  # Schedule the next update
+        frame = self.sub.poll()  # newest frame not shown yet, never blocks the Tk loop
+        if frame is not None:
+            frame = cv.resize(frame[0], (self.width, self.height), interpolation=cv.INTER_AREA)  # low res preview
+            self.photo.paste(Image.fromarray(cv.cvtColor(frame, cv.COLOR_BGR2RGB)))  # Convert frame colors from BGR to RGB
+        if self.sub.alive:
+            self.cv_frame.after(self.interval, self.update_video_feed)  # Schedule the next update
+
+    def destroy(self):
+        self.sub.close()  # release the camera once no one else uses it
+        super().destroy()